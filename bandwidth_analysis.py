@@ -1,64 +1,729 @@
 #pip install matplotlib pandas
-""" You can adjust the interval by changing the INTERVAL constant at the top of the script. For example:
+""" You can adjust the interval by changing the INTERVAL constant at the top of the script, or with --interval. For example:
 For 1-second intervals: INTERVAL = 1.0
 For 100ms intervals: INTERVAL = 0.1
-For 10-second intervals: INTERVAL = 10.0"""
+For 10-second intervals: INTERVAL = 10.0
+Packets are binned once at RESOLUTION (1 ms) and every coarser interval is rolled up from that
+histogram, so with the cache below switching intervals does not re-read any capture.
+Captures are streamed packet by packet; set STREAMING = False to load each file with rdpcap instead.
+With FAST_PATH = True, Ethernet pcaps are classified straight from the header bytes and scapy
+only dissects the frames the fast path cannot classify with certainty.
+With VECTORIZED = True, packets are buffered as (timestamp, length, protocol) columns and binned
+with NumPy in chunks; intervals are exact integer nanosecond buckets and timestamps are only
+formatted once per bucket when the CSV is written.
+Run with --workers N to spread files (and byte ranges of large files) over N processes, or with
+--scaling to time the same analysis at 1/2/4/8 workers.
+Per-file results are cached under <folder>/.bandwidth_cache (--no-cache to disable), so re-runs
+only analyze new or changed captures and resume growing captures from their last complete record.
+LiveBandwidthMonitor applies the same classification to captures while tcpdump is still writing
+them (tailed files, rotating segments or `tcpdump -w -` pipes), for live per-protocol rates
+during an experiment.
+Bandwidth is computed from each packet's original wire length, so captures taken with a small
+snaplen give the same results as full captures. Rotated capture segments (tcpdump -C/-G) are
+indexed by time range in the cache directory; --start/--end analyze only the segments that
+overlap that window.
+With --top-flows K, the same pass also counts bytes per 5-tuple flow and writes the K biggest
+flows of every interval to top_flows.csv. The interval being read keeps a Space-Saving sketch
+of FLOW_COUNTERS counters and finished intervals only their top K, so memory does not grow
+with the number of flows; --bench-flows times this on a synthetic capture with 1M distinct flows."""
 
 
 import os
+import re
 import csv
-from scapy.all import ARP, ICMP, TCP, UDP, IP, IPv6, ICMPv6EchoRequest, ICMPv6EchoReply, rdpcap, ICMPv6ND_NS, ICMPv6ND_NA
+import glob
+import json
+import time
+import argparse
+import math
+import struct
+import heapq
+import hashlib
+import resource
+import socket
+import tempfile
+import selectors
+import threading
+from array import array
+from decimal import Decimal
+from scapy.all import ARP, ICMP, TCP, UDP, IP, IPv6, ICMPv6EchoRequest, ICMPv6EchoReply, rdpcap, PcapReader, ICMPv6ND_NS, ICMPv6ND_NA, Ether, conf
 from datetime import datetime
+import numpy as np
 import matplotlib.pyplot as plt
 import pandas as pd
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 
 # Configuration
 pcap_folder = "/home/ictlab7/Documents/Mininet_Learning/"
 output_csv = "bandwidth_usage.csv"
 INTERVAL = 0.1  # Time window in seconds
+RESOLUTION = 0.001  # Finest bucket width in seconds; reporting intervals are rolled up from it
+STREAMING = True  # Read pcaps packet by packet instead of loading them whole with rdpcap
+FAST_PATH = True  # Classify frames from raw header bytes, falling back to scapy when unsure
+VECTORIZED = True  # Bin packets with NumPy instead of one dict update per packet
+BIN_CHUNK = 1 << 20  # Packets buffered before a vectorized binning pass
+MIN_SPLIT_BYTES = 32 * 1024 * 1024  # Smallest byte range handed to one worker
+MAX_SPLIT_BYTES = 256 * 1024 * 1024  # Largest byte range handed to one worker
+CACHE_DIRNAME = '.bandwidth_cache'  # Created inside the pcap folder
+HASH_HEAD_BYTES = 1024 * 1024  # Bytes hashed at the start of a capture to fingerprint it
+HASH_TAIL_BYTES = 64 * 1024  # Bytes hashed just before the last processed offset
+LIVE_POLL_INTERVAL = 0.2  # Seconds between reads of tailed captures in live mode
+LIVE_HISTORY = 60  # Seconds of live per-interval totals kept in memory
+CACHE_VERSION = 2  # Bump when cached histograms change meaning (2: wire lengths)
+SEGMENT_INDEX = 'segments.json'  # Time ranges of the capture segments, kept in the cache directory
+PCAP_NAME = re.compile(r'\.pcap\d*$')  # tcpdump -C appends a segment number after the extension
+TOP_FLOWS = 0  # Biggest flows per interval written to top_flows.csv (0 = no flow accounting)
+FLOW_COUNTERS = 1024  # Space-Saving counters per interval while the interval is being read
+top_flows_csv = "top_flows.csv"
+
+# Protocol columns in CSV order; the fast path classifies frames into indexes of this list
+PROTOCOLS = ['TCP', 'UDP', 'ICMP', 'ICMPv6', 'ARP', 'Other']
+PROTO_TCP, PROTO_UDP, PROTO_ICMP, PROTO_ICMPV6, PROTO_ARP, PROTO_OTHER = range(len(PROTOCOLS))
+
+# Classic pcap magic -> (struct byte order, sub-second ticks per second)
+PCAP_MAGIC = {
+    b'\xd4\xc3\xb2\xa1': ('<', 10**6),
+    b'\xa1\xb2\xc3\xd4': ('>', 10**6),
+    b'\x4d\x3c\xb2\xa1': ('<', 10**9),
+    b'\xa1\xb2\x3c\x4d': ('>', 10**9),
+}
+PCAP_GLOBAL_HEADER_LEN = 24
+PCAP_RECORD_HEADER_LEN = 16
+LINKTYPE_ETHERNET = 1
+SCAPY_MTU = 0xffff  # PcapReader truncates every frame to this many bytes
+MAX_RECORD_LEN = 262144  # Largest caplen/wire length libpcap writes
+RESYNC_RECORDS = 8  # Plausible record headers in a row that confirm a record boundary
+
+VLAN_ETHERTYPES = (0x8100, 0x88a8)
+ICMP_FIXED_HEADER_TYPES = (0, 3, 5, 8, 11, 12)  # ICMP types scapy dissects from an 8 byte header
+ICMPV6_MIN_LEN = {128: 8, 129: 8, 135: 24, 136: 24}  # Echo request/reply, neighbor solicit/advert
+ICMPV6_NESTED_TYPES = (1, 2, 3, 4, 137)  # Errors and redirects quote the offending packet
+# UDP ports scapy decodes into tunnels that may carry TCP/UDP/ICMP of their own
+UDP_TUNNEL_PORTS = frozenset([1701, 2152, 3544, 4341, 4342, 4754, 4789, 4790, 6081, 6635, 8472])
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (ru_maxrss is in KB on Linux)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+def report_performance(pcap_file, packet_count, elapsed):
+    """Print packets/sec and peak RSS so memory growth across file sizes is visible"""
+    rate = packet_count / elapsed if elapsed > 0 else 0.0
+    size_mb = os.path.getsize(pcap_file) / (1024.0 * 1024.0)
+    print(f"{os.path.basename(pcap_file)}: {packet_count} packets ({size_mb:.1f} MB) in {elapsed:.2f}s "
+          f"({rate:,.0f} packets/sec), peak RSS {peak_rss_mb():.1f} MB")
+
+def classify_packet(packet):
+    """Classify a dissected scapy packet into a PROTOCOLS index"""
+    if TCP in packet:
+        return PROTO_TCP
+    elif UDP in packet:
+        return PROTO_UDP
+    elif ICMP in packet:
+        return PROTO_ICMP
+    elif IPv6 in packet and (ICMPv6EchoRequest in packet or ICMPv6EchoReply in packet or 
+                            ICMPv6ND_NS in packet or ICMPv6ND_NA in packet):
+        return PROTO_ICMPV6
+    elif ARP in packet:
+        return PROTO_ARP
+    return PROTO_OTHER
+
+def dissect_frame(frame):
+    """Dissect a raw Ethernet frame with scapy the way PcapReader would"""
+    try:
+        return Ether(frame)
+    except Exception:
+        return conf.raw_layer(frame)  # What PcapReader yields for undissectable frames
+
+def read_pcap_header(f):
+    """Read a classic pcap global header, returning (byte order, ticks per second, linktype).
+    Returns None for pcapng or anything else the raw reader does not understand."""
+    header = f.read(PCAP_GLOBAL_HEADER_LEN)
+    if len(header) < PCAP_GLOBAL_HEADER_LEN or header[:4] not in PCAP_MAGIC:
+        return None
+    endian, ticks = PCAP_MAGIC[header[:4]]
+    linktype = struct.unpack(endian + 'I', header[20:24])[0]
+    return endian, ticks, linktype
+
+def wire_length(packet):
+    """Original length of a packet on the wire; larger than len(packet) when the capture
+    was taken with a snaplen"""
+    return getattr(packet, 'wirelen', None) or len(packet)
+
+def packet_time_ns(packet):
+    """Exact capture time of a scapy packet in integer nanoseconds"""
+    # str() keeps every digit of scapy's Decimal timestamps (and the shortest repr of floats)
+    return int(Decimal(str(packet.time)).scaleb(9))
+
+def iter_pcap_records(f, endian, ticks, end=None):
+    """Yield (timestamp_ns, frame, wire length) for every complete record from the current position,
+    stopping at byte offset end if given. The file is left positioned after the last
+    complete record, so f.tell() is where a later run can resume."""
+    record = struct.Struct(endian + 'IIII')
+    ns_per_tick = 10**9 // ticks
+    read = f.read
+    position = f.tell()
+    while end is None or position < end:
+        header = read(PCAP_RECORD_HEADER_LEN)
+        if len(header) < PCAP_RECORD_HEADER_LEN:
+            f.seek(position)
+            return
+        sec, frac, caplen, wirelen = record.unpack(header)
+        frame = read(caplen)
+        if len(frame) < caplen:
+            f.seek(position)  # Truncated final record, possibly still being written
+            return
+        position += PCAP_RECORD_HEADER_LEN + caplen
+        yield sec * 10**9 + frac * ns_per_tick, frame[:SCAPY_MTU], wirelen
+
+def split_pcap(pcap_file, split_bytes=None, start=None):
+    """Split a classic pcap, from byte offset start onwards, into (start, end, resync) byte
+    ranges of split_bytes (one range if split_bytes is None) without reading any records.
+    Only the first range starts on a record; the others have resync set, and whoever reads
+    them starts at find_record(). A record belongs to the range its header starts in.
+    Returns [(None, None, False)] for files the fast path cannot read."""
+    with open(pcap_file, 'rb') as f:
+        header = read_pcap_header(f)
+        if header is None or header[2] != LINKTYPE_ETHERNET:
+            return [(None, None, False)]
+        size = os.fstat(f.fileno()).st_size
+    if start is None:
+        start = PCAP_GLOBAL_HEADER_LEN
+    if split_bytes is None or size - start <= split_bytes:
+        return [(start, size, False)]
+    return [(offset, min(offset + split_bytes, size), offset != start)
+            for offset in range(start, size, split_bytes)]
+
+def find_record(pcap_file, start, end):
+    """Offset of the first record header at or after byte offset start, or None if no
+    record starts before end. A candidate offset must be followed by RESYNC_RECORDS
+    plausible headers in a row (or by plausible headers up to the end of the file):
+    sub-second field in range, caplen within the snaplen and at most the wire length,
+    and timestamps within a day of each other."""
+    with open(pcap_file, 'rb') as f:
+        global_header = f.read(PCAP_GLOBAL_HEADER_LEN)
+        endian, ticks = PCAP_MAGIC[global_header[:4]]
+        snaplen = struct.unpack(endian + 'I', global_header[16:20])[0]
+        limit = snaplen if 0 < snaplen <= MAX_RECORD_LEN else MAX_RECORD_LEN
+        # A record starts within one maximal record of any offset; the chain needs a few more
+        f.seek(start)
+        data = f.read((PCAP_RECORD_HEADER_LEN + limit) * (RESYNC_RECORDS + 1))
+    record = struct.Struct(endian + 'IIII')
+    size = len(data)
+
+    def plausible(position, first_sec):
+        sec, frac, caplen, wirelen = record.unpack_from(data, position)
+        return (frac < ticks and caplen <= limit and caplen <= wirelen <= MAX_RECORD_LEN
+                and abs(sec - first_sec) <= 86400)
+
+    for candidate in range(min(end - start, PCAP_RECORD_HEADER_LEN + limit, size - PCAP_RECORD_HEADER_LEN + 1)):
+        first_sec = record.unpack_from(data, candidate)[0]
+        position = candidate
+        confirmed = 0
+        while confirmed < RESYNC_RECORDS:
+            # data holds a full chain unless the file ends first
+            if position + PCAP_RECORD_HEADER_LEN > size or not plausible(position, first_sec):
+                break
+            position += PCAP_RECORD_HEADER_LEN + record.unpack_from(data, position)[2]
+            confirmed += 1
+            if position > size:
+                break  # The file ends inside this record, which may still be being written
+        if confirmed == RESYNC_RECORDS or (confirmed and position + PCAP_RECORD_HEADER_LEN > size):
+            return start + candidate
+    return None
+
+def analyze_pcap_task(task):
+    """Analyze one file or byte range (in a pool worker or in-process) and return
+    (buckets, bit_totals, offset after the last complete record or None, ok, FlowTracker or None,
+    offset of the first record read or None)"""
+    pcap_file, start, end, interval, top_flows, resync = task
+    analyzer = BandwidthAnalyzer(interval, top_flows=top_flows)
+    try:
+        if resync:
+            start = find_record(pcap_file, start, end)
+            if start is None:
+                return analyzer.histogram() + (None, True, analyzer.flows, None)
+        if start is None:
+            offset = analyzer.analyze_pcap(pcap_file)
+        else:
+            offset = analyzer.analyze_pcap_fast(pcap_file, start, end)
+    except Exception as e:
+        print(f"Error processing file {pcap_file}: {e}")
+        return analyzer.histogram() + (None, False, analyzer.flows, start)
+    return analyzer.histogram() + (offset, True, analyzer.flows, start)
+
+def combine_histograms(histograms):
+    """Sum (buckets, bit_totals) histograms into one sorted by bucket"""
+    buckets = np.concatenate([h[0] for h in histograms])
+    totals = np.concatenate([h[1] for h in histograms])
+    merged, inverse = np.unique(buckets, return_inverse=True)
+    combined = np.zeros((len(merged), len(PROTOCOLS)), dtype=np.int64)
+    np.add.at(combined, inverse, totals)
+    return merged, combined
+
+class BandwidthRollup:
+    """Per-protocol histograms of the same packets at several resolutions. Only the finest
+    level is built from packets; coarser levels are summed from the finest level that
+    divides them and kept for later queries."""
+    def __init__(self, resolution_ns, buckets, bit_totals):
+        self.resolution_ns = resolution_ns
+        self.levels = {resolution_ns: (buckets, bit_totals)}
+
+    def query(self, interval, start=None, end=None):
+        """Return (bucket indexes, bit totals) at interval seconds, where bucket * interval is
+        the bucket start, optionally restricted to buckets starting in [start, end) epoch seconds"""
+        width_ns = int(round(interval * 10**9))
+        if width_ns <= 0 or width_ns % self.resolution_ns:
+            raise ValueError(f"Interval {interval}s is not a multiple of the "
+                             f"{self.resolution_ns / 10**9}s resolution")
+        if width_ns not in self.levels:
+            source_ns = max(level for level in self.levels if width_ns % level == 0)
+            self.levels[width_ns] = self.downsample(*self.levels[source_ns], width_ns // source_ns)
+        buckets, bit_totals = self.levels[width_ns]
+
+        if start is not None or end is not None:
+            first = 0 if start is None else np.searchsorted(buckets, -(-int(start * 10**9) // width_ns))
+            last = len(buckets) if end is None else np.searchsorted(buckets, -(-int(end * 10**9) // width_ns))
+            buckets, bit_totals = buckets[first:last], bit_totals[first:last]
+        return buckets, bit_totals
+
+    @staticmethod
+    def downsample(buckets, bit_totals, factor):
+        """Merge every factor consecutive buckets of a sorted histogram"""
+        if len(buckets) == 0:
+            return buckets, bit_totals
+        coarse = buckets // factor
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(coarse)) + 1))
+        return coarse[starts], np.add.reduceat(bit_totals, starts, axis=0)
+
+class PcapCache:
+    """Per-file histograms at one resolution, stored as .npz files. An entry is keyed by the
+    capture's path and the resolution and is only reused while the capture's size, mtime and
+    content fingerprint still match; captures that only grew are resumed from the stored offset."""
+    def __init__(self, cache_dir, resolution_ns):
+        self.cache_dir = cache_dir
+        self.resolution_ns = resolution_ns
+
+    def entry_file(self, pcap_file):
+        key = hashlib.sha1(os.path.abspath(pcap_file).encode()).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f'{key}_{self.resolution_ns}_v{CACHE_VERSION}.npz')
+
+    @staticmethod
+    def fingerprint(pcap_file, offset):
+        """SHA-1 of the head of the file and of the bytes just before offset"""
+        digest = hashlib.sha1(str(offset).encode())
+        with open(pcap_file, 'rb') as f:
+            head = f.read(min(offset, HASH_HEAD_BYTES))
+            digest.update(head)
+            tail_start = max(len(head), offset - HASH_TAIL_BYTES)
+            f.seek(tail_start)
+            digest.update(f.read(offset - tail_start))
+        return digest.hexdigest()
+
+    def lookup(self, pcap_file):
+        """Return ('fresh', entry) for an unchanged capture, ('resume', entry) for one that
+        grew past a resumable offset, or (None, None) when it has to be analyzed from scratch"""
+        entry_file = self.entry_file(pcap_file)
+        if not os.path.exists(entry_file):
+            return None, None
+        try:
+            with np.load(entry_file) as data:
+                entry = {name: data[name] for name in data.files}
+            file_stat = os.stat(pcap_file)
+            offset = int(entry['offset'])
+            if str(entry['path']) != os.path.abspath(pcap_file) or file_stat.st_size < offset:
+                return None, None
+            if self.fingerprint(pcap_file, offset) != str(entry['digest']):
+                return None, None
+        except Exception as e:
+            print(f"Ignoring cache entry for {pcap_file}: {e}")
+            return None, None
+
+        if file_stat.st_size == int(entry['size']) and file_stat.st_mtime_ns == int(entry['mtime_ns']):
+            return 'fresh', entry
+        if bool(entry['resumable']):
+            return 'resume', entry
+        return None, None
+
+    def store(self, pcap_file, file_stat, buckets, bit_totals, offset):
+        """Save a capture's histogram; offset is None when the capture cannot be resumed"""
+        resumable = offset is not None
+        if not resumable:
+            offset = file_stat.st_size
+        entry_file = self.entry_file(pcap_file)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(entry_file + '.tmp', 'wb') as f:
+                np.savez(f, path=os.path.abspath(pcap_file), size=file_stat.st_size,
+                         mtime_ns=file_stat.st_mtime_ns, offset=offset, resumable=resumable,
+                         digest=self.fingerprint(pcap_file, offset),
+                         buckets=buckets, bit_totals=bit_totals)
+            os.replace(entry_file + '.tmp', entry_file)
+        except Exception as e:
+            print(f"Could not cache results for {pcap_file}: {e}")
+
+def classify_frame(frame):
+    """Classify a raw Ethernet frame into a PROTOCOLS index exactly as process_packet would.
+    Returns None when the frame needs full scapy dissection to be classified reliably."""
+    caplen = len(frame)
+    if caplen < 14:
+        return None
+    offset = 12
+    ethertype = frame[12] << 8 | frame[13]
+    while ethertype in VLAN_ETHERTYPES:
+        offset += 4
+        if caplen < offset + 2:
+            return None
+        ethertype = frame[offset] << 8 | frame[offset + 1]
+    offset += 2
+
+    if ethertype == 0x0800:
+        # IPv4 without options; anything else goes to scapy
+        if caplen < offset + 20 or frame[offset] != 0x45:
+            return None
+        ip_len = frame[offset + 2] << 8 | frame[offset + 3]
+        if ip_len < 20:
+            return None
+        if (frame[offset + 6] & 0x1f) or frame[offset + 7]:
+            return PROTO_OTHER  # Non-first fragments carry no transport header
+        proto = frame[offset + 9]
+        l4 = offset + 20
+        avail = min(caplen - offset, ip_len) - 20
+        if proto == 6:
+            if avail >= 20 and 20 <= (frame[l4 + 12] >> 4) * 4 <= avail:
+                return PROTO_TCP
+        elif proto == 17:
+            if avail >= 8:
+                sport = frame[l4] << 8 | frame[l4 + 1]
+                dport = frame[l4 + 2] << 8 | frame[l4 + 3]
+                if sport not in UDP_TUNNEL_PORTS and dport not in UDP_TUNNEL_PORTS:
+                    return PROTO_UDP
+        elif proto == 1:
+            if avail >= 8 and frame[l4] in ICMP_FIXED_HEADER_TYPES:
+                return PROTO_ICMP
+        return None
+
+    if ethertype == 0x86DD:
+        if caplen < offset + 40 or frame[offset] >> 4 != 6:
+            return None
+        plen = frame[offset + 4] << 8 | frame[offset + 5]
+        if plen == 0:
+            return None  # Jumbogram
+        nh = frame[offset + 6]
+        l4 = offset + 40
+        avail = min(caplen - l4, plen)
+        extension = False
+        while nh in (0, 60):  # Hop-by-hop and destination options (MLD reports use these)
+            if avail < 8:
+                return None
+            ext_len = (frame[l4 + 1] + 1) * 8
+            if avail < ext_len:
+                return None
+            nh = frame[l4]
+            l4 += ext_len
+            avail -= ext_len
+            extension = True
+        if nh == 58:
+            if avail < 1:
+                return None
+            icmp_type = frame[l4]
+            if icmp_type in ICMPV6_MIN_LEN:
+                if not extension and avail >= ICMPV6_MIN_LEN[icmp_type]:
+                    return PROTO_ICMPV6
+                return None
+            if icmp_type in ICMPV6_NESTED_TYPES:
+                return None
+            return PROTO_OTHER  # MLD, router/neighbor discovery extras
+        if extension:
+            return None
+        if nh == 6:
+            if avail >= 20 and 20 <= (frame[l4 + 12] >> 4) * 4 <= avail:
+                return PROTO_TCP
+        elif nh == 17:
+            if avail >= 8:
+                sport = frame[l4] << 8 | frame[l4 + 1]
+                dport = frame[l4 + 2] << 8 | frame[l4 + 3]
+                if sport not in UDP_TUNNEL_PORTS and dport not in UDP_TUNNEL_PORTS:
+                    return PROTO_UDP
+        return None
+
+    if ethertype == 0x0806:
+        return PROTO_ARP if caplen - offset >= 28 else None
+
+    return None
+
+IP_PROTOCOL_NAMES = {1: 'ICMP', 6: 'TCP', 17: 'UDP', 58: 'ICMPv6', 132: 'SCTP'}
+PORT_PROTOCOLS = frozenset([6, 17, 132])  # Transport headers that start with two 16-bit ports
+NO_PORTS = bytes(4)
+
+def flow_key(frame):
+    """5-tuple of an Ethernet frame packed into bytes (source and destination address,
+    IP protocol, source and destination port), or None for non-IP frames. Ports are zero
+    for protocols without them and for non-first fragments."""
+    caplen = len(frame)
+    if caplen < 14:
+        return None
+    offset = 12
+    ethertype = frame[12] << 8 | frame[13]
+    while ethertype in VLAN_ETHERTYPES:
+        offset += 4
+        if caplen < offset + 2:
+            return None
+        ethertype = frame[offset] << 8 | frame[offset + 1]
+    offset += 2
+    if ethertype == 0x0800:
+        if caplen < offset + 20:
+            return None
+        proto = frame[offset + 9]
+        key = frame[offset + 12:offset + 20] + frame[offset + 9:offset + 10]
+        l4 = offset + (frame[offset] & 0x0f) * 4
+        if (frame[offset + 6] & 0x1f) or frame[offset + 7]:
+            return key + NO_PORTS
+    elif ethertype == 0x86DD:
+        if caplen < offset + 40:
+            return None
+        proto = frame[offset + 6]  # Extension headers are not followed
+        key = frame[offset + 8:offset + 40] + frame[offset + 6:offset + 7]
+        l4 = offset + 40
+    else:
+        return None
+    if proto in PORT_PROTOCOLS and caplen >= l4 + 4:
+        return key + frame[l4:l4 + 4]
+    return key + NO_PORTS
+
+def describe_flow(key):
+    """(source, source port, destination, destination port, protocol) of a flow_key"""
+    size = (len(key) - 5) // 2
+    family = socket.AF_INET if size == 4 else socket.AF_INET6
+    proto = key[2 * size]
+    sport, dport = struct.unpack('!HH', key[2 * size + 1:])
+    return (socket.inet_ntop(family, key[:size]), sport, socket.inet_ntop(family, key[size:2 * size]), dport,
+            IP_PROTOCOL_NAMES.get(proto, str(proto)))
+
+class SpaceSaving:
+    """Space-Saving heavy hitters over weighted keys with at most capacity counters.
+    A key without a counter takes over the smallest one and inherits its count as
+    error, so a count overestimates the key's true total by at most its error, and
+    every key with more than total / capacity is guaranteed to have a counter.
+    Counters dropped by resize() or merge() raise dropped, the most a key without a
+    counter can have had, and a key that gets a counter again starts from there."""
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counters = {}  # key -> [count, error]
+        self.heap = []      # one (count, key) per counter; the count may be stale (too low)
+        self.total = 0
+        self.dropped = 0
+
+    def add(self, key, weight):
+        self.total += weight
+        counter = self.counters.get(key)
+        if counter is not None:
+            counter[0] += weight
+            return
+        if len(self.counters) < self.capacity:
+            self.counters[key] = [self.dropped + weight, self.dropped]
+            heapq.heappush(self.heap, (self.dropped + weight, key))
+            return
+        # Find the true minimum, refreshing entries whose counters grew since they were pushed
+        heap = self.heap
+        while True:
+            count, victim = heap[0]
+            current = self.counters[victim][0]
+            if current == count:
+                break
+            heapq.heapreplace(heap, (current, victim))
+        del self.counters[victim]
+        self.counters[key] = [count + weight, count]
+        heapq.heapreplace(heap, (count + weight, key))
+
+    def floor(self):
+        """Most a key without a counter can have had"""
+        if len(self.counters) < self.capacity:
+            return self.dropped
+        return max(self.dropped, min(count for count, _ in self.counters.values()))
+
+    def merge(self, other):
+        """Add another sketch of a different part of the stream; the result keeps the
+        Space-Saving guarantees with the combined errors"""
+        floors = (self.floor(), other.floor())
+        merged = {}
+        for key in self.counters.keys() | other.counters.keys():
+            mine = self.counters.get(key, (floors[0], floors[0]))
+            theirs = other.counters.get(key, (floors[1], floors[1]))
+            merged[key] = [mine[0] + theirs[0], mine[1] + theirs[1]]
+        self.total += other.total
+        self.counters = merged
+        self.dropped = floors[0] + floors[1]
+        self.resize(self.capacity)
+
+    def resize(self, capacity):
+        """Keep only the capacity biggest counters"""
+        self.capacity = capacity
+        if len(self.counters) > capacity:
+            keep = heapq.nlargest(capacity, self.counters.items(), key=lambda item: item[1][0])
+            self.dropped = max(self.dropped, keep[-1][1][0])
+            self.counters = dict(keep)
+        self.heap = [(counter[0], key) for key, counter in self.counters.items()]
+        heapq.heapify(self.heap)
+
+    def top(self, k):
+        """The k biggest (key, count, error), biggest first"""
+        return [(key, count, error) for key, (count, error) in
+                heapq.nlargest(k, self.counters.items(), key=lambda item: item[1][0])]
+
+class FlowTracker:
+    """Bytes per 5-tuple flow for each reporting interval, in one SpaceSaving sketch per
+    interval. Only the intervals a tracker may share with other byte ranges (its first
+    one and the one being read) keep capacity counters; when a later interval starts,
+    the one before is cut down to its top keep counters (the K written out), so each
+    finished interval costs K counters whatever the number of flows. Trackers of
+    different files or byte ranges merge per interval at full size; close() cuts
+    everything to keep once all parts are in, so an interval split between two byte
+    ranges gets the same counts as when it is read in one piece."""
+    def __init__(self, interval_ns, keep, capacity=FLOW_COUNTERS):
+        self.interval_ns = interval_ns
+        self.keep = keep
+        self.capacity = capacity
+        self.sketches = {}  # interval bucket -> SpaceSaving
+        self.first = None   # Bucket of the first packet; the previous range may hold the rest of it
+        self.bucket = None
+        self.sketch = None
+
+    def add(self, packet_time, frame, packet_len):
+        key = flow_key(frame)
+        if key is None:
+            return
+        bucket = packet_time // self.interval_ns
+        if bucket != self.bucket:
+            if self.sketch is not None and self.bucket != self.first:
+                self.sketch.resize(self.keep)
+            if self.first is None:
+                self.first = bucket
+            self.sketch = self.sketches.get(bucket)
+            if self.sketch is None:
+                self.sketch = self.sketches[bucket] = SpaceSaving(self.capacity)
+            else:
+                self.sketch.resize(self.capacity)  # Out-of-order packets reopen an interval
+            self.bucket = bucket
+        self.sketch.add(key, packet_len)
+
+    def close(self):
+        """Cut every interval down to its top keep counters; call once all parts are merged"""
+        for sketch in self.sketches.values():
+            sketch.resize(self.keep)
+        self.first = self.bucket = self.sketch = None
+
+    def merge(self, other):
+        for bucket, sketch in other.sketches.items():
+            mine = self.sketches.get(bucket)
+            if mine is None:
+                self.sketches[bucket] = sketch
+                continue
+            # Keep the larger size until close(), so a split interval is not cut before it is whole
+            capacity = max(mine.capacity, sketch.capacity)
+            mine.capacity = capacity
+            mine.merge(sketch)
 
 class BandwidthAnalyzer:
-    def __init__(self, interval):
+    def __init__(self, interval, streaming=STREAMING, fast_path=FAST_PATH, vectorized=VECTORIZED,
+                 resolution=RESOLUTION, top_flows=TOP_FLOWS):
         self.interval = interval
-        self.stats = defaultdict(lambda: {
-            'timestamp': None,
-            'TCP': 0,
-            'UDP': 0,
-            'ICMP': 0,
-            'ICMPv6': 0,
-            'ARP': 0,
-            'Other': 0
-        })
+        self.interval_ns = int(round(interval * 10**9))
+        # Packets are binned at the finest width that divides both the interval and the resolution
+        self.resolution_ns = math.gcd(self.interval_ns, int(round(resolution * 10**9)))
+        self.streaming = streaming
+        self.fast_path = fast_path
+        self.vectorized = vectorized
+        # (start, end) epoch seconds that save_results is restricted to; None leaves a side open
+        self.window = (None, None)
+        # Histogram parts at resolution_ns, combined lazily by histogram()
+        self.parts = []
+        # Columnar buffers of packets not yet binned (or per-bucket totals when not vectorized)
+        self.pending_times = array('q')
+        self.pending_lengths = array('I')
+        self.pending_protocols = array('B')
+        self.pending_stats = defaultdict(lambda: [0] * len(PROTOCOLS))
+        # Per-interval heavy hitters, counted in the same pass when top_flows is set
+        self.top_flows = top_flows
+        self.flows = FlowTracker(self.interval_ns, top_flows) if top_flows else None
         print(f"Initializing bandwidth analysis with {interval} second intervals")
 
-    def process_packet(self, packet, packet_time):
+    def process_packet(self, packet, packet_time, packet_len=None):
         """Process a single packet and update bandwidth statistics"""
-        interval_key = int(packet_time / self.interval) * self.interval
-        packet_size = len(packet) * 8  # Convert bytes to bits
-        
-        # Update timestamp
-        if self.stats[interval_key]['timestamp'] is None:
-            self.stats[interval_key]['timestamp'] = datetime.fromtimestamp(interval_key).strftime('%Y-%m-%d %H:%M:%S')
-
-        # Classify packet and update bandwidth
-        if TCP in packet:
-            self.stats[interval_key]['TCP'] += packet_size
-        elif UDP in packet:
-            self.stats[interval_key]['UDP'] += packet_size
-        elif ICMP in packet:
-            self.stats[interval_key]['ICMP'] += packet_size
-        elif IPv6 in packet and (ICMPv6EchoRequest in packet or ICMPv6EchoReply in packet or 
-                                ICMPv6ND_NS in packet or ICMPv6ND_NA in packet):
-            self.stats[interval_key]['ICMPv6'] += packet_size
-        elif ARP in packet:
-            self.stats[interval_key]['ARP'] += packet_size
-        else:
-            self.stats[interval_key]['Other'] += packet_size
+        self.add_sample(packet_time, classify_packet(packet), packet_len or wire_length(packet))
+
+    def add_sample(self, packet_time, protocol, packet_len):
+        """Add one classified packet (timestamp in ns, PROTOCOLS index, length in bytes)"""
+        if self.vectorized:
+            self.pending_times.append(packet_time)
+            self.pending_lengths.append(packet_len)
+            self.pending_protocols.append(protocol)
+            if len(self.pending_times) >= BIN_CHUNK:
+                self.flush_pending()
+            return
+
+        self.pending_stats[packet_time // self.resolution_ns][protocol] += packet_len * 8  # Convert bytes to bits
+
+    def flush_pending(self):
+        """Bin the buffered packets in one vectorized pass"""
+        if self.pending_stats:
+            buckets = sorted(self.pending_stats)
+            self.merge_histogram(np.array(buckets, dtype=np.int64),
+                                 np.array([self.pending_stats[bucket] for bucket in buckets], dtype=np.int64))
+            self.pending_stats.clear()
+        if not self.pending_times:
+            return
+        times = np.frombuffer(self.pending_times, dtype=np.int64)
+        lengths = np.frombuffer(self.pending_lengths, dtype=np.uint32)
+        protocols = np.frombuffer(self.pending_protocols, dtype=np.uint8)
+
+        buckets, inverse = np.unique(times // self.resolution_ns, return_inverse=True)
+        cells = inverse * len(PROTOCOLS) + protocols
+        totals = np.bincount(cells, weights=lengths, minlength=len(buckets) * len(PROTOCOLS))
+        self.merge_histogram(buckets, totals.reshape(-1, len(PROTOCOLS)).astype(np.int64) * 8)  # Bytes to bits
+
+        self.pending_times = array('q')
+        self.pending_lengths = array('I')
+        self.pending_protocols = array('B')
+
+    def histogram(self):
+        """Return (bucket indexes, bit totals with columns ordered like PROTOCOLS) at
+        resolution_ns as arrays sorted by bucket"""
+        self.flush_pending()
+        if len(self.parts) != 1:
+            empty = (np.zeros(0, dtype=np.int64), np.zeros((0, len(PROTOCOLS)), dtype=np.int64))
+            self.parts = [combine_histograms(self.parts or [empty])]
+        return self.parts[0]
+
+    def merge_histogram(self, buckets, bit_totals):
+        """Add per-bucket bit totals at resolution_ns (columns ordered like PROTOCOLS).
+        Merging is a plain sum, so partial histograms can be combined in any order."""
+        self.parts.append((buckets, bit_totals))
+        if len(self.parts) > 64:
+            self.parts = [combine_histograms(self.parts)]
+
+    def rollup(self):
+        """All resolutions of the current histogram behind one query API"""
+        return BandwidthRollup(self.resolution_ns, *self.histogram())
+
+    @property
+    def stats(self):
+        """Bits per protocol for each interval, keyed by bucket index (timestamp_ns // interval_ns)"""
+        buckets, bit_totals = self.rollup().query(self.interval)
+        return {bucket: dict(zip(PROTOCOLS, row)) for bucket, row in zip(buckets.tolist(), bit_totals.tolist())}
 
     def analyze_pcap(self, pcap_file):
-        """Analyze a PCAP file and calculate bandwidth usage"""
+        """Analyze a PCAP file and calculate bandwidth usage. Returns the byte offset after the
+        last complete record when the fast path read the file, otherwise None."""
+        if self.fast_path:
+            offset = self.analyze_pcap_fast(pcap_file)
+            if offset:
+                return offset
+        if self.streaming:
+            return self.analyze_pcap_streaming(pcap_file)
+
         print(f"Processing {pcap_file}...")
+        start = time.perf_counter()
         packets = rdpcap(pcap_file)
         total_packets = len(packets)
         print(f"Loaded {total_packets} packets")
@@ -68,36 +733,222 @@ class BandwidthAnalyzer:
                 print(f"Processed {i}/{total_packets} packets...")
             
             try:
-                packet_time = float(packet.time)
+                packet_time = packet_time_ns(packet)
                 self.process_packet(packet, packet_time)
+                if self.flows is not None:
+                    self.flows.add(packet_time, bytes(packet), wire_length(packet))
             except Exception as e:
                 print(f"Error processing packet {i}: {e}")
                 continue
         
+        self.flush_pending()
         print(f"Finished processing {total_packets} packets")
+        report_performance(pcap_file, total_packets, time.perf_counter() - start)
+        return None
+
+    def analyze_pcap_streaming(self, pcap_file):
+        """Analyze a PCAP file one packet at a time so memory stays flat regardless of file size"""
+        print(f"Streaming {pcap_file}...")
+        start = time.perf_counter()
+        total_packets = 0
+
+        # PcapReader only keeps the packet being dissected in memory
+        with PcapReader(pcap_file) as packets:
+            for i, packet in enumerate(packets):
+                if i % 10000 == 0:
+                    print(f"Processed {i} packets...")
+
+                total_packets += 1
+                try:
+                    packet_time = packet_time_ns(packet)
+                    self.process_packet(packet, packet_time)
+                    if self.flows is not None:
+                        self.flows.add(packet_time, bytes(packet), wire_length(packet))
+                except Exception as e:
+                    print(f"Error processing packet {i}: {e}")
+                    continue
+
+        self.flush_pending()
+        print(f"Finished processing {total_packets} packets")
+        report_performance(pcap_file, total_packets, time.perf_counter() - start)
+
+    def analyze_pcap_fast(self, pcap_file, start_offset=None, end_offset=None):
+        """Analyze an Ethernet pcap (or a record-aligned byte range of one) from raw record
+        and header bytes. Returns the byte offset after the last complete record processed,
+        or False without touching the stats if the file needs scapy."""
+        with open(pcap_file, 'rb') as f:
+            header = read_pcap_header(f)
+            if header is None or header[2] != LINKTYPE_ETHERNET:
+                return False
+            if start_offset is not None:
+                f.seek(start_offset)
+                print(f"Processing {pcap_file} bytes {start_offset}-{end_offset} (fast path)...")
+            else:
+                print(f"Processing {pcap_file} (fast path)...")
+
+            start = time.perf_counter()
+            total_packets = 0
+            fallbacks = 0
+            records = iter_pcap_records(f, header[0], header[1], end_offset)
+            flows = self.flows
+            for i, (packet_time, frame, packet_len) in enumerate(records):
+                if i % 100000 == 0:
+                    print(f"Processed {i} packets...")
+
+                total_packets += 1
+                if flows is not None:
+                    flows.add(packet_time, frame, packet_len)
+                protocol = classify_frame(frame)
+                if protocol is not None:
+                    self.add_sample(packet_time, protocol, packet_len)
+                    continue
+
+                fallbacks += 1
+                try:
+                    self.process_packet(dissect_frame(frame), packet_time, packet_len)
+                except Exception as e:
+                    print(f"Error processing packet {i}: {e}")
+            offset = f.tell()
+
+        self.flush_pending()
+        print(f"Finished processing {total_packets} packets ({fallbacks} dissected with scapy)")
+        report_performance(pcap_file, total_packets, time.perf_counter() - start)
+        return offset
+
+    def analyze_files(self, pcap_files, workers=1, cache=None):
+        """Analyze pcap files, fanning files and byte ranges of large files out to a process
+        pool when workers > 1. Partial histograms are merged into self.stats; with a
+        PcapCache, unchanged files are not read again and grown files are only read from
+        where the previous run stopped."""
+        split_bytes = None
+        if workers > 1:
+            total_bytes = sum(os.path.getsize(pcap_file) for pcap_file in pcap_files)
+            split_bytes = min(MAX_SPLIT_BYTES, max(MIN_SPLIT_BYTES, total_bytes // (workers * 4)))
+
+        tasks = []
+        file_stats = {}
+        previous = {}  # Cached histograms of resumed files
+        for pcap_file in pcap_files:
+            try:
+                # Cache entries hold no flows, so flow accounting reads every file again
+                status, entry = cache.lookup(pcap_file) if cache and self.flows is None else (None, None)
+                if status == 'fresh':
+                    print(f"Using cached results for {pcap_file}")
+                    self.merge_histogram(entry['buckets'], entry['bit_totals'])
+                    continue
+
+                start = None
+                if status == 'resume':
+                    start = int(entry['offset'])
+                    previous[pcap_file] = (entry['buckets'], entry['bit_totals'])
+                    print(f"Resuming {pcap_file} from byte {start}")
+                file_stats[pcap_file] = os.stat(pcap_file)
+                ranges = split_pcap(pcap_file, split_bytes, start)
+            except Exception as e:
+                print(f"Error processing file {pcap_file}: {e}")
+                continue
+            tasks.extend((pcap_file, start, end, self.interval, self.top_flows, resync)
+                         for start, end, resync in ranges)
+
+        if workers > 1 and len(tasks) > 1:
+            print(f"Analyzing {len(file_stats)} files as {len(tasks)} tasks on {workers} workers")
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(analyze_pcap_task, tasks))
+        else:
+            results = [analyze_pcap_task(task) for task in tasks]
+        tasks, results = self.check_boundaries(tasks, results)
+
+        histograms = defaultdict(list)
+        offsets = {}
+        failed = set()
+        for task, (buckets, bit_totals, offset, ok, flows, _) in zip(tasks, results):
+            pcap_file = task[0]
+            histograms[pcap_file].append((buckets, bit_totals))
+            if flows is not None:
+                self.flows.merge(flows)
+            if not ok:
+                failed.add(pcap_file)
+            elif offset is not None:
+                offsets[pcap_file] = max(offset, offsets.get(pcap_file, 0))
+
+        if self.flows is not None:
+            self.flows.close()  # Every part of each interval is in; keep its top K
+
+        for pcap_file, parts in histograms.items():
+            if pcap_file in previous:
+                parts.append(previous[pcap_file])
+            buckets, bit_totals = combine_histograms(parts)
+            self.merge_histogram(buckets, bit_totals)
+            if cache and pcap_file not in failed:
+                cache.store(pcap_file, file_stats[pcap_file], buckets, bit_totals, offsets.get(pcap_file))
+
+    def check_boundaries(self, tasks, results):
+        """Make sure the byte ranges of each file were read back to back: every range must
+        start where the previous one stopped reading, and a range without a record must
+        lie before that point. A file where a range resynced to the wrong offset is read
+        again in one pass instead, so no record is lost or counted twice."""
+        reached = {}  # file -> offset where the previous range stopped reading
+        misaligned = set()
+        for (pcap_file, start, end, *_), (_, _, offset, ok, _, first) in zip(tasks, results):
+            if not ok or start is None:
+                reached[pcap_file] = None  # Failed ranges are reported as such; nothing to compare
+                continue
+            previous = reached.get(pcap_file)
+            if first is None:
+                if previous is not None and previous < end:
+                    misaligned.add(pcap_file)
+                continue
+            if previous is not None and first != previous:
+                misaligned.add(pcap_file)
+            reached[pcap_file] = offset
+        if not misaligned:
+            return tasks, results
+        kept = [(task, result) for task, result in zip(tasks, results) if task[0] not in misaligned]
+        for pcap_file in sorted(misaligned):
+            print(f"Byte ranges of {pcap_file} did not line up on record boundaries; reading it in one pass")
+            first = next(task for task in tasks if task[0] == pcap_file)
+            task = (pcap_file, first[1], None, self.interval, self.top_flows, False)
+            kept.append((task, analyze_pcap_task(task)))
+        return [task for task, _ in kept], [result for _, result in kept]
 
     def save_results(self):
         """Save bandwidth statistics to CSV"""
+        buckets, bit_totals = self.rollup().query(self.interval, *self.window)
         print(f"Saving results to {output_csv}")
         with open(output_csv, 'w', newline='') as csvfile:
             writer = csv.writer(csvfile)
-            # Write header
-            writer.writerow(['Timestamp', 'TCP_bps', 'UDP_bps', 'ICMP_bps', 'ICMPv6_bps', 'ARP_bps', 'Other_bps'])
+            # Write header; Timestamp_ms tells apart sub-second intervals that share a Timestamp
+            writer.writerow(['Timestamp', 'Timestamp_ms', 'TCP_bps', 'UDP_bps', 'ICMP_bps', 'ICMPv6_bps', 'ARP_bps', 'Other_bps'])
             
-            # Sort by timestamp and write data
-            sorted_times = sorted(self.stats.keys())
-            for t in sorted_times:
-                stats = self.stats[t]
+            # Buckets are sorted by timestamp
+            for bucket, row in zip(buckets.tolist(), bit_totals.tolist()):
+                start_ns = bucket * self.interval_ns
                 # Convert to bits per second
                 writer.writerow([
-                    stats['timestamp'],
-                    stats['TCP'] / self.interval,
-                    stats['UDP'] / self.interval,
-                    stats['ICMP'] / self.interval,
-                    stats['ICMPv6'] / self.interval,
-                    stats['ARP'] / self.interval,
-                    stats['Other'] / self.interval
-                ])
+                    datetime.fromtimestamp(start_ns / 10**9).strftime('%Y-%m-%d %H:%M:%S'),
+                    start_ns // 10**6,
+                ] + [total / self.interval for total in row])
+
+    def save_top_flows(self):
+        """Save the biggest flows of every interval to CSV, biggest first. Bytes may
+        overestimate a flow by up to Error_bytes (the Space-Saving error)."""
+        start_ns, end_ns = (None if value is None else int(value * 10**9) for value in self.window)
+        print(f"Saving top {self.top_flows} flows per interval to {top_flows_csv}")
+        with open(top_flows_csv, 'w', newline='') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(['Timestamp', 'Timestamp_ms', 'Rank', 'Src', 'Sport', 'Dst', 'Dport', 'Protocol',
+                             'Bytes', 'bps', 'Error_bytes', 'Interval_bytes'])
+            for bucket in sorted(self.flows.sketches):
+                bucket_start = bucket * self.interval_ns
+                # Same rule as BandwidthRollup.query: intervals starting in [start, end)
+                if ((start_ns is not None and bucket_start < start_ns)
+                        or (end_ns is not None and bucket_start >= end_ns)):
+                    continue
+                sketch = self.flows.sketches[bucket]
+                timestamp = datetime.fromtimestamp(bucket_start / 10**9).strftime('%Y-%m-%d %H:%M:%S')
+                for rank, (key, count, error) in enumerate(sketch.top(self.top_flows), 1):
+                    writer.writerow([timestamp, bucket_start // 10**6, rank, *describe_flow(key),
+                                     count, count * 8 / self.interval, error, sketch.total])
 
     def plot_bandwidth(self):
         """Create bandwidth usage plots"""
@@ -144,22 +995,495 @@ class BandwidthAnalyzer:
         plt.savefig('bandwidth_usage_log.png')
         print("Log scale plot saved as bandwidth_usage_log.png")
 
-def main():
-    # Create analyzer instance with specified interval
-    analyzer = BandwidthAnalyzer(INTERVAL)
-    
-    # Process each pcap file in the folder
-    for filename in os.listdir(pcap_folder):
-        if filename.endswith('.pcap'):
-            full_path = os.path.join(pcap_folder, filename)
+class PcapStreamParser:
+    """Incremental parser for a classic pcap that is still being written. feed() takes
+    whatever bytes are available and returns the (timestamp_ns, frame, wire length) records
+    completed so far."""
+    def __init__(self):
+        self.buffer = bytearray()
+        self.record = None
+        self.ns_per_tick = None
+
+    def feed(self, data):
+        self.buffer += data
+        offset = 0
+        if self.record is None:
+            if len(self.buffer) < PCAP_GLOBAL_HEADER_LEN:
+                return []
+            magic = bytes(self.buffer[:4])
+            if magic not in PCAP_MAGIC:
+                raise ValueError("not a classic pcap stream")
+            endian, ticks = PCAP_MAGIC[magic]
+            if struct.unpack_from(endian + 'I', self.buffer, 20)[0] != LINKTYPE_ETHERNET:
+                raise ValueError("only Ethernet captures are supported")
+            self.record = struct.Struct(endian + 'IIII')
+            self.ns_per_tick = 10**9 // ticks
+            offset = PCAP_GLOBAL_HEADER_LEN
+
+        records = []
+        available = len(self.buffer)
+        while available - offset >= PCAP_RECORD_HEADER_LEN:
+            sec, frac, caplen, wirelen = self.record.unpack_from(self.buffer, offset)
+            end = offset + PCAP_RECORD_HEADER_LEN + caplen
+            if end > available:
+                break
+            frame = bytes(self.buffer[offset + PCAP_RECORD_HEADER_LEN:min(end, offset + PCAP_RECORD_HEADER_LEN + SCAPY_MTU)])
+            records.append((sec * 10**9 + frac * self.ns_per_tick, frame, wirelen))
+            offset = end
+        del self.buffer[:offset]
+        return records
+
+class LiveBandwidthMonitor:
+    """Per-protocol bandwidth of captures that tcpdump is still writing. A single thread
+    multiplexes every source: pipes (e.g. `tcpdump -U -w -` stdout) through a selector, and
+    capture files by polling for new bytes every poll_interval, so a slow or idle capture
+    never blocks the others. Packets are binned into interval buckets as they arrive."""
+    def __init__(self, interval=1.0, poll_interval=LIVE_POLL_INTERVAL, history=LIVE_HISTORY):
+        self.interval = interval
+        self.interval_ns = int(round(interval * 10**9))
+        self.poll_interval = poll_interval
+        self.max_buckets = max(2, int(history / interval))
+        self.sources = {}  # name -> {'parser', 'path', 'pattern', 'file', 'stream'}
+        self.selector = selectors.DefaultSelector()
+        self.buckets = {}  # bucket index -> bits per PROTOCOLS column
+        self.packets = 0
+        self.last_packet_ns = None
+        self.lock = threading.Lock()
+        self.running = False
+        self.thread = None
+
+    def add_file(self, name, path):
+        """Tail a pcap file; it may not exist yet when tcpdump has just been started"""
+        with self.lock:
+            self.sources[name] = {'parser': PcapStreamParser(), 'path': path, 'pattern': None,
+                                  'file': None, 'stream': None}
+
+    def add_segments(self, name, pattern):
+        """Follow a rotating capture (tcpdump -C/-G): tail the segment files matching a glob
+        pattern in modification order, moving to the next one when tcpdump rotates"""
+        with self.lock:
+            self.sources[name] = {'parser': PcapStreamParser(), 'path': None, 'pattern': pattern,
+                                  'file': None, 'stream': None}
+
+    def add_stream(self, name, stream):
+        """Read a pcap from a pipe such as a tcpdump -w - stdout"""
+        os.set_blocking(stream.fileno(), False)
+        with self.lock:
+            self.sources[name] = {'parser': PcapStreamParser(), 'path': None, 'pattern': None,
+                                  'file': None, 'stream': stream}
+            self.selector.register(stream, selectors.EVENT_READ, name)
+
+    def remove(self, name):
+        """Stop following a source"""
+        with self.lock:
+            source = self.sources.pop(name, None)
+            if source and source['stream'] is not None:
+                self.selector.unregister(source['stream'])
+            if source and source['file'] is not None:
+                source['file'].close()
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+        print(f"Live bandwidth analysis started ({self.interval}s intervals)")
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+        for name in list(self.sources):
+            self.remove(name)
+        print("Live bandwidth analysis stopped")
+
+    def run(self):
+        while self.running:
             try:
-                analyzer.analyze_pcap(full_path)
+                # Pipes wake the loop as soon as they have data; files are polled on each timeout
+                if self.selector.get_map():
+                    events = self.selector.select(timeout=self.poll_interval)
+                else:
+                    events = []
+                    time.sleep(self.poll_interval)
+                for key, _ in events:
+                    data = os.read(key.fileobj.fileno(), 1 << 16)
+                    if data:
+                        self.consume(key.data, data)
+                    else:
+                        self.remove(key.data)  # Writer closed the pipe
+                for name in [name for name, source in list(self.sources.items())
+                             if source['path'] or source['pattern']]:
+                    self.poll_file(name)
             except Exception as e:
-                print(f"Error processing file {filename}: {e}")
+                print(f"Error in live bandwidth analysis: {e}")
+
+    def segments(self, pattern):
+        """Segment files of a rotating capture, oldest first"""
+        paths = []
+        for path in glob.glob(pattern):
+            try:
+                paths.append((os.stat(path).st_mtime_ns, path))
+            except OSError:
+                pass  # Removed by tcpdump's ring rotation in the meantime
+        return [path for _, path in sorted(paths)]
+
+    def next_segment(self, source):
+        """The segment written after the one being tailed, or None"""
+        segments = self.segments(source['pattern'])
+        if source['path'] not in segments:
+            return segments[0] if segments else None
+        position = segments.index(source['path'])
+        return segments[position + 1] if position + 1 < len(segments) else None
+
+    def poll_file(self, name):
+        """Read whatever a tailed capture gained since the last poll"""
+        source = self.sources.get(name)
+        if source is None:
+            return
+        if source['pattern'] and source['path'] is None:
+            source['path'] = self.next_segment(source)
+            if source['path'] is None:
+                return
+        self.read_file(name, source)
+        while source['pattern']:
+            following = self.next_segment(source)
+            if following is None:
+                return
+            # tcpdump closed this segment when it opened the next; take its last packets first
+            self.read_file(name, source)
+            if source['file'] is not None:
+                source['file'].close()
+            source['path'], source['file'] = following, None
+            source['parser'] = PcapStreamParser()
+            self.read_file(name, source)
+
+    def read_file(self, name, source):
+        """Consume everything appended to the source's current file since the last read"""
+        try:
+            size = os.path.getsize(source['path'])
+        except OSError:
+            return  # Not created yet, or already removed by a ring rotation
+        if source['file'] is None:
+            source['file'] = open(source['path'], 'rb')
+        elif size < source['file'].tell():
+            # Truncated or replaced: start over with a fresh parser
+            source['file'].close()
+            source['file'] = open(source['path'], 'rb')
+            source['parser'] = PcapStreamParser()
+        while True:
+            data = source['file'].read(1 << 20)
+            if not data:
+                return
+            self.consume(name, data)
+
+    def consume(self, name, data):
+        source = self.sources.get(name)
+        if source is None:
+            return
+        try:
+            records = source['parser'].feed(data)
+        except ValueError as e:
+            print(f"Stopped following {name}: {e}")
+            self.remove(name)
+            return
+
+        with self.lock:
+            for packet_time, frame, packet_len in records:
+                protocol = classify_frame(frame)
+                if protocol is None:
+                    try:
+                        protocol = classify_packet(dissect_frame(frame))
+                    except Exception:
+                        protocol = PROTO_OTHER
+                bucket = packet_time // self.interval_ns
+                totals = self.buckets.get(bucket)
+                if totals is None:
+                    totals = self.buckets[bucket] = [0] * len(PROTOCOLS)
+                totals[protocol] += packet_len * 8  # Convert bytes to bits
+                self.packets += 1
+                if self.last_packet_ns is None or packet_time > self.last_packet_ns:
+                    self.last_packet_ns = packet_time
+            # Drop buckets that fell out of the history window
+            if len(self.buckets) > self.max_buckets:
+                for bucket in sorted(self.buckets)[:-self.max_buckets]:
+                    del self.buckets[bucket]
+
+    def add_counts(self, packet_time, bit_totals):
+        """Add bits per PROTOCOLS column counted outside a capture (e.g. tc counters),
+        in the bucket of packet_time (ns)"""
+        with self.lock:
+            totals = self.buckets.setdefault(packet_time // self.interval_ns, [0] * len(PROTOCOLS))
+            for column, bits in enumerate(bit_totals):
+                totals[column] += bits
+            if len(self.buckets) > self.max_buckets:
+                for bucket in sorted(self.buckets)[:-self.max_buckets]:
+                    del self.buckets[bucket]
+
+    def current_rates(self):
+        """Bits per second by protocol over the most recent completed interval"""
+        bucket = time.time_ns() // self.interval_ns - 1
+        with self.lock:
+            totals = self.buckets.get(bucket, [0] * len(PROTOCOLS))
+            return {protocol: total / self.interval for protocol, total in zip(PROTOCOLS, totals)}
+
+    def print_rates(self):
+        """Print the current per-protocol rates"""
+        rates = self.current_rates()
+        print(f"\nLive bandwidth ({self.interval}s interval, {len(self.sources)} captures, {self.packets:,} packets):")
+        print("-" * 40)
+        for protocol, bps in rates.items():
+            print(f"{protocol:<8} {bps / 1e6:>12.3f} Mbps")
+        print(f"{'Total':<8} {sum(rates.values()) / 1e6:>12.3f} Mbps")
+        if self.last_packet_ns is not None:
+            print(f"Newest packet seen {time.time() - self.last_packet_ns / 10**9:.1f}s ago")
+
+def list_pcaps(folder):
+    """All .pcap files in a folder, including rotated segments such as capture.pcap1"""
+    return [os.path.join(folder, filename) for filename in sorted(os.listdir(folder))
+            if PCAP_NAME.search(filename)]
+
+def scan_segment(pcap_file):
+    """Time range, packet count and wire bytes of a classic pcap from its record headers
+    only; None if the file is not a classic pcap"""
+    with open(pcap_file, 'rb') as f:
+        header = read_pcap_header(f)
+        if header is None:
+            return None
+        record = struct.Struct(header[0] + 'IIII')
+        ns_per_tick = 10**9 // header[1]
+        size = os.fstat(f.fileno()).st_size
+        first_ns = last_ns = None
+        packets = wire_bytes = 0
+        position = PCAP_GLOBAL_HEADER_LEN
+        while position + PCAP_RECORD_HEADER_LEN <= size:
+            f.seek(position)
+            sec, frac, caplen, wirelen = record.unpack(f.read(PCAP_RECORD_HEADER_LEN))
+            position += PCAP_RECORD_HEADER_LEN + caplen
+            if position > size:
+                break  # Truncated final record
+            packet_time = sec * 10**9 + frac * ns_per_tick
+            first_ns = packet_time if first_ns is None else min(first_ns, packet_time)
+            last_ns = packet_time if last_ns is None else max(last_ns, packet_time)
+            packets += 1
+            wire_bytes += wirelen
+    return {'first_ns': first_ns, 'last_ns': last_ns, 'packets': packets, 'wire_bytes': wire_bytes}
+
+class SegmentIndex:
+    """Time range of every capture segment in a folder, saved as SEGMENT_INDEX in the cache
+    directory. Segments are only rescanned when their size or mtime changed, so selecting
+    the segments of a time window costs a stat per file."""
+    def __init__(self, folder, cache_dir=None):
+        self.folder = folder
+        self.path = os.path.join(cache_dir or os.path.join(folder, CACHE_DIRNAME), SEGMENT_INDEX)
+        self.entries = {}  # file name -> scan_segment() fields plus size and mtime_ns
+        try:
+            with open(self.path) as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def refresh(self):
+        """Rescan new and changed segments, forget removed ones and save the index"""
+        entries = {}
+        for pcap_file in list_pcaps(self.folder):
+            name = os.path.basename(pcap_file)
+            try:
+                file_stat = os.stat(pcap_file)
+                entry = self.entries.get(name)
+                if (entry is None or entry['size'] != file_stat.st_size
+                        or entry['mtime_ns'] != file_stat.st_mtime_ns):
+                    entry = scan_segment(pcap_file)
+                    if entry is None:
+                        continue
+                    entry.update(size=file_stat.st_size, mtime_ns=file_stat.st_mtime_ns)
+            except Exception as e:
+                print(f"Could not index {pcap_file}: {e}")
+                continue
+            entries[name] = entry
+        self.entries = entries
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path + '.tmp', 'w') as f:
+                json.dump(entries, f)
+            os.replace(self.path + '.tmp', self.path)
+        except Exception as e:
+            print(f"Could not save segment index: {e}")
+        return self
+
+    def select(self, start=None, end=None):
+        """Segments holding packets in [start, end) epoch seconds"""
+        start_ns = None if start is None else int(start * 10**9)
+        end_ns = None if end is None else int(end * 10**9)
+        return [os.path.join(self.folder, name) for name, entry in sorted(self.entries.items())
+                if entry['packets']
+                and (end_ns is None or entry['first_ns'] < end_ns)
+                and (start_ns is None or entry['last_ns'] >= start_ns)]
+
+    def report(self):
+        """Print each segment's time range and its disk bytes per packet"""
+        print(f"\n{'Segment':<48} {'From':>19} {'To':>19} {'Packets':>10} {'Disk B/pkt':>10} {'Wire B/pkt':>10}")
+        for name, entry in sorted(self.entries.items()):
+            if not entry['packets']:
                 continue
+            first, last = (datetime.fromtimestamp(entry[key] / 10**9).strftime('%Y-%m-%d %H:%M:%S')
+                           for key in ('first_ns', 'last_ns'))
+            print(f"{name:<48} {first:>19} {last:>19} {entry['packets']:>10} "
+                  f"{entry['size'] / entry['packets']:>10.1f} {entry['wire_bytes'] / entry['packets']:>10.1f}")
+
+def parse_time(text):
+    """Epoch seconds, or a local 'YYYY-mm-dd HH:MM:SS' as written in the Timestamp column"""
+    try:
+        return float(text)
+    except ValueError:
+        return datetime.strptime(text, '%Y-%m-%d %H:%M:%S').timestamp()
+
+def run_analysis(pcap_files, workers, cache_dir=None, interval=INTERVAL, top_flows=TOP_FLOWS):
+    """Analyze pcap files sequentially or on a process pool, returning the analyzer"""
+    analyzer = BandwidthAnalyzer(interval, top_flows=top_flows)
+    if top_flows and cache_dir:
+        print("Flow accounting reads every file; cached histograms are refreshed but not used")
+    # Cache entries hold the finest histogram, so they serve every interval built on it
+    cache = PcapCache(cache_dir, analyzer.resolution_ns) if cache_dir else None
+    analyzer.analyze_files(pcap_files, workers, cache)
+    return analyzer
+
+def measure_scaling(pcap_files, worker_counts=(1, 2, 4, 8)):
+    """Time the same analysis at several worker counts and print the speedups"""
+    total_mb = sum(os.path.getsize(pcap_file) for pcap_file in pcap_files) / (1024.0 * 1024.0)
+    timings = []
+    for workers in worker_counts:
+        start = time.perf_counter()
+        run_analysis(pcap_files, workers)
+        timings.append((workers, time.perf_counter() - start))
+
+    print(f"\nScaling over {len(pcap_files)} files ({total_mb:.1f} MB, {os.cpu_count()} CPUs):")
+    print(f"{'Workers':>8} {'Seconds':>10} {'MB/s':>10} {'Speedup':>8}")
+    for workers, elapsed in timings:
+        print(f"{workers:>8} {elapsed:>10.2f} {total_mb / elapsed:>10.1f} {timings[0][1] / elapsed:>7.2f}x")
+
+def write_flow_benchmark_pcap(path, flows, heavy_flows, heavy_packets, duration=1.0):
+    """Synthetic capture: flows single-packet UDP flows with distinct 5-tuples, interleaved
+    with heavy_flows TCP flows of heavy_packets full-size packets each, spread over duration
+    seconds. Frames are captured at header length only. Returns {flow_key: bytes} of the heavy flows."""
+    record = struct.Struct('<IIII')
+    eth = b'\x00\x00\x00\x00\x00\x02\x00\x00\x00\x00\x00\x01\x08\x00'
+    heavy_total = heavy_flows * heavy_packets
+    total = flows + heavy_total
+    heavy_every = max(1, total // max(1, heavy_total))
+    expected = defaultdict(int)
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, LINKTYPE_ETHERNET))
+        light = heavy = 0
+        for i in range(total):
+            usec = int(i * duration * 10**6 / total)
+            if heavy < heavy_total and (i % heavy_every == 0 or light == flows):
+                flow = heavy % heavy_flows
+                heavy += 1
+                addresses = bytes((10, 1, 0, flow + 1, 10, 2, 0, 1))
+                frame = (eth + bytes((0x45, 0, 0x05, 0xdc, 0, 0, 0x40, 0, 64, 6, 0, 0)) + addresses
+                         + struct.pack('!HHIIBBHHH', 40000 + flow, 5001, 0, 0, 0x50, 0x10, 65535, 0, 0))
+                wirelen = 1514
+                expected[addresses + bytes((6,)) + frame[34:38]] += wirelen
+            else:
+                # Sources and ports together make every light flow distinct
+                addresses = b'\x0a\x03' + struct.pack('!H', light >> 10) + b'\x0a\x04\x00\x01'
+                frame = (eth + bytes((0x45, 0, 0, 28, 0, 0, 0x40, 0, 64, 17, 0, 0)) + addresses
+                         + struct.pack('!HHHH', 20000 + (light & 0x3ff), 53, 8, 0))
+                wirelen = 64
+                light += 1
+            f.write(record.pack(usec // 10**6, usec % 10**6, len(frame), wirelen) + frame)
+    return dict(expected)
+
+def benchmark_flows(flows=1000000, heavy_flows=20, heavy_packets=5000, top_flows=None):
+    """Time the fast path with and without flow accounting on a synthetic capture with
+    flows distinct flows, and check that the heavy flows come out on top"""
+    top_flows = top_flows or heavy_flows
+    with tempfile.TemporaryDirectory() as tmp:
+        pcap_file = os.path.join(tmp, 'flows.pcap')
+        print(f"Writing {flows:,} distinct flows plus {heavy_flows} heavy flows to {pcap_file}")
+        expected = write_flow_benchmark_pcap(pcap_file, flows, heavy_flows, heavy_packets)
+        packets = flows + heavy_flows * heavy_packets
+
+        timings = []
+        for k in (0, top_flows):
+            analyzer = BandwidthAnalyzer(1.0, top_flows=k)
+            start = time.perf_counter()
+            analyzer.analyze_pcap_fast(pcap_file)
+            timings.append((k, time.perf_counter() - start, peak_rss_mb()))
+
+    print(f"\nFlow accounting over {packets:,} packets ({flows + heavy_flows:,} flows):")
+    print(f"{'Top flows':>10} {'Seconds':>10} {'Packets/s':>12} {'Peak RSS MB':>12}")
+    for k, elapsed, rss in timings:
+        print(f"{k or 'off':>10} {elapsed:>10.2f} {packets / elapsed:>12,.0f} {rss:>12.1f}")
+    print(f"Flow accounting overhead: {timings[1][1] / timings[0][1] - 1:.0%}")
+
+    analyzer.flows.close()
+    counters = sum(len(sketch.counters) for sketch in analyzer.flows.sketches.values())
+    top = [entry for sketch in analyzer.flows.sketches.values() for entry in sketch.top(top_flows)]
+    top_keys = {key for key, _, _ in top}
+    found = sum(key in top_keys for key in expected)
+    errors = [abs(count - expected.get(key, 0)) / expected[key] for key, count, _ in top if key in expected]
+    print(f"Counters held: {counters} (for {flows + heavy_flows:,} flows)")
+    print(f"Heavy flows in the top {top_flows}: {found}/{len(expected)}, "
+          f"largest byte overestimate {max(errors, default=0):.2%}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-protocol bandwidth usage from pcap captures')
+    parser.add_argument('--folder', default=pcap_folder, help='Folder containing the .pcap files')
+    parser.add_argument('--interval', type=float, default=INTERVAL, help='Reporting interval in seconds')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes for the analysis')
+    parser.add_argument('--scaling', action='store_true', help='Report run times for 1/2/4/8 workers and exit')
+    parser.add_argument('--cache-dir', help=f'Cache directory (default: <folder>/{CACHE_DIRNAME})')
+    parser.add_argument('--no-cache', action='store_true', help='Analyze every file from scratch')
+    parser.add_argument('--start', type=parse_time,
+                        help="Only analyze from this time (epoch seconds or 'YYYY-mm-dd HH:MM:SS')")
+    parser.add_argument('--end', type=parse_time, help='Only analyze up to this time')
+    parser.add_argument('--segments', action='store_true',
+                        help='Print the capture segment index and exit')
+    parser.add_argument('--top-flows', type=int, default=TOP_FLOWS, metavar='K',
+                        help=f'Also write the K biggest 5-tuple flows of every interval to {top_flows_csv}')
+    parser.add_argument('--bench-flows', action='store_true',
+                        help='Benchmark flow accounting on a synthetic capture with 1M distinct flows and exit')
+    args = parser.parse_args()
+
+    if args.bench_flows:
+        benchmark_flows(top_flows=args.top_flows)
+        return
+
+    pcap_files = list_pcaps(args.folder)
+    if args.scaling:
+        measure_scaling(pcap_files)
+        return
+
+    window = args.start is not None or args.end is not None
+    if window or args.segments:
+        index = SegmentIndex(args.folder, args.cache_dir).refresh()
+        if args.segments:
+            index.report()
+            return
+        pcap_files = index.select(args.start, args.end)
+        total_bytes = sum(entry['size'] for entry in index.entries.values())
+        selected_bytes = sum(os.path.getsize(pcap_file) for pcap_file in pcap_files)
+        print(f"Window covers {len(pcap_files)} of {len(index.entries)} segments "
+              f"({selected_bytes / 1e6:.1f} of {total_bytes / 1e6:.1f} MB)")
+
+    # Process each pcap file in the folder
+    start = time.perf_counter()
+    cache_dir = None if args.no_cache else (args.cache_dir or os.path.join(args.folder, CACHE_DIRNAME))
+    analyzer = run_analysis(pcap_files, args.workers, cache_dir, args.interval, args.top_flows)
+    if window:
+        analyzer.window = (args.start, args.end)
+        elapsed = time.perf_counter() - start
+        if selected_bytes:
+            # Skipped segments would have been read at the same rate as the selected ones
+            saved = elapsed * (total_bytes - selected_bytes) / selected_bytes
+            print(f"Analysis took {elapsed:.2f}s; skipping the other segments saved about {saved:.2f}s")
     
     # Save results and create plots
     analyzer.save_results()
+    if analyzer.flows is not None:
+        analyzer.save_top_flows()
     analyzer.plot_bandwidth()
     print(f"Analysis complete. Results saved to {output_csv}")
 
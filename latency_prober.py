@@ -0,0 +1,348 @@
+"""
+High-rate latency probing between Mininet hosts, one process per host.
+
+Each host runs this script once (LatencyProbers starts it through node.popen). The
+process answers other hosts' probes and, for its list of targets, sends interleaved
+probes to every target at a fixed rate over each protocol:
+    icmp  echo request / reply on a raw socket
+    udp   datagram to PROBE_UDP_PORT, echoed back by the target's process
+    tcp   connect to PROBE_TCP_PORT; the RTT is the SYN / SYN-ACK handshake
+One protocol per queue of the QoS flow rules (ICMP, TCP and UDP are each sent to their
+own queue), so the latency of every priority class is measured separately.
+
+Every RTT goes into a LatencyHistogram: log-linear buckets with 2**SUB_BUCKET_BITS
+sub-buckets per power of two of microseconds, so any percentile is within ~3% and
+histograms from different intervals or processes merge by adding bucket counts. A
+probe without a reply after PROBE_TIMEOUT seconds counts as lost. Every report
+interval the process prints one JSON line per target and protocol with the probes
+sent and lost and the histogram of that interval.
+
+Run by hand inside a host, e.g.
+    python latency_prober.py --targets 10.0.0.2 10.0.0.3 --rate 50 --protocols icmp udp
+"""
+import os
+import sys
+import json
+import time
+import errno
+import signal
+import socket
+import struct
+import argparse
+import selectors
+import itertools
+import threading
+import subprocess
+
+PROBE_UDP_PORT = 7007
+PROBE_TCP_PORT = 7008
+PROBE_TIMEOUT = 1.0         # seconds before an unanswered probe counts as lost
+PROBE_PROTOCOLS = ('icmp', 'udp', 'tcp')
+SUB_BUCKET_BITS = 5         # 32 sub-buckets per power of two: <= 3.1% bucket width
+UDP_PROBE = struct.Struct('!4sI')  # magic, sequence number
+UDP_MAGIC = b'LPRB'
+
+class LatencyHistogram:
+    """HDR-style histogram of latencies in microseconds. Values below
+    2**(SUB_BUCKET_BITS + 1) have a bucket each; above that every power of two is
+    split into 2**SUB_BUCKET_BITS buckets. Counts are a sparse {bucket: count} dict."""
+    SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+    def __init__(self, counts=None):
+        self.counts = {}
+        if counts:
+            self.merge(counts)
+
+    @classmethod
+    def bucket(cls, value):
+        value = max(0, int(value))
+        if value < 2 * cls.SUB_BUCKETS:
+            return value
+        shift = value.bit_length() - SUB_BUCKET_BITS - 1
+        return (shift + 1) * cls.SUB_BUCKETS + (value >> shift) - cls.SUB_BUCKETS
+
+    @classmethod
+    def bucket_value(cls, bucket):
+        """Midpoint of a bucket's value range"""
+        if bucket < 2 * cls.SUB_BUCKETS:
+            return bucket
+        shift = bucket // cls.SUB_BUCKETS - 1
+        low = (bucket % cls.SUB_BUCKETS + cls.SUB_BUCKETS) << shift
+        return low + ((1 << shift) - 1) / 2
+
+    def record(self, value_us, count=1):
+        bucket = self.bucket(value_us)
+        self.counts[bucket] = self.counts.get(bucket, 0) + count
+
+    def merge(self, other):
+        """Add another histogram, or its counts dict (JSON keys may be strings)"""
+        counts = other.counts if isinstance(other, LatencyHistogram) else other
+        for bucket, count in counts.items():
+            bucket = int(bucket)
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+
+    def total(self):
+        return sum(self.counts.values())
+
+    def percentile(self, percent):
+        """Value at a percentile (0-100) in microseconds, or None when empty"""
+        total = self.total()
+        if not total:
+            return None
+        rank = max(1, -(-total * percent // 100))  # Nearest rank, rounded up
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                return self.bucket_value(bucket)
+
+    def copy(self):
+        return LatencyHistogram(self.counts)
+
+def icmp_checksum(data):
+    if len(data) % 2:
+        data += b'\0'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+class Prober:
+    """Responder for other hosts' probes plus the probe loop towards this host's targets"""
+    def __init__(self, targets, rate, protocols, report_interval):
+        self.targets = targets
+        self.protocols = [protocol for protocol in PROBE_PROTOCOLS if protocol in protocols]
+        self.report_interval = report_interval
+        self.selector = selectors.DefaultSelector()
+        self.outstanding = {}  # (protocol, sequence) -> (target, sent ns)
+        self.sequence = itertools.count(1)
+        self.icmp_id = os.getpid() & 0xffff
+        self.running = True
+        # Interval results per (target, protocol): [sent, lost, histogram]
+        self.results = {(target, protocol): [0, 0, LatencyHistogram()]
+                        for target in targets for protocol in self.protocols}
+        # Interleave targets and protocols evenly over each probe period
+        self.schedule = itertools.cycle(list(self.results))
+        self.gap_ns = int(10**9 / (rate * len(self.results))) if self.results else None
+
+        # Responders, so this host answers the other hosts' udp and tcp probes
+        self.udp_server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.udp_server.bind(('0.0.0.0', PROBE_UDP_PORT))
+        self.udp_server.setblocking(False)
+        self.selector.register(self.udp_server, selectors.EVENT_READ, 'udp-server')
+        self.tcp_server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.tcp_server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.tcp_server.bind(('0.0.0.0', PROBE_TCP_PORT))
+        self.tcp_server.listen(1024)
+        self.tcp_server.setblocking(False)
+        self.selector.register(self.tcp_server, selectors.EVENT_READ, 'tcp-server')
+
+        self.udp = self.icmp = None
+        if 'udp' in self.protocols:
+            self.udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.udp.setblocking(False)
+            self.selector.register(self.udp, selectors.EVENT_READ, 'udp')
+        if 'icmp' in self.protocols:
+            # The kernel answers echo requests itself; this socket only reads the replies
+            self.icmp = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+            self.icmp.setblocking(False)
+            self.selector.register(self.icmp, selectors.EVENT_READ, 'icmp')
+
+    def send(self, target, protocol):
+        sequence = next(self.sequence) & 0xffffffff
+        now = time.monotonic_ns()
+        try:
+            if protocol == 'icmp':
+                header = struct.pack('!BBHHH', 8, 0, 0, self.icmp_id, sequence & 0xffff)
+                payload = struct.pack('!I', sequence)
+                packet = header[:2] + struct.pack('!H', icmp_checksum(header + payload)) + header[4:] + payload
+                self.icmp.sendto(packet, (target, 0))
+            elif protocol == 'udp':
+                self.udp.sendto(UDP_PROBE.pack(UDP_MAGIC, sequence), (target, PROBE_UDP_PORT))
+            else:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                sock.setblocking(False)
+                # Reset instead of FIN on close, so thousands of probes leave no TIME_WAIT
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+                error = sock.connect_ex((target, PROBE_TCP_PORT))
+                if error not in (0, errno.EINPROGRESS):
+                    sock.close()
+                    raise OSError(error, os.strerror(error))
+                self.selector.register(sock, selectors.EVENT_WRITE, ('tcp', sequence))
+        except OSError:
+            pass  # Unreachable right now; the probe times out and counts as lost
+        self.outstanding[(protocol, sequence)] = (target, now)
+        self.results[(target, protocol)][0] += 1
+
+    def answer(self, protocol, sequence):
+        sent = self.outstanding.pop((protocol, sequence), None)
+        if sent is not None:
+            target, sent_ns = sent
+            self.results[(target, protocol)][2].record((time.monotonic_ns() - sent_ns) / 1000)
+
+    def handle(self, key):
+        kind = key.data
+        if kind == 'udp-server':
+            data, address = self.udp_server.recvfrom(64)
+            if data[:4] == UDP_MAGIC:
+                self.udp_server.sendto(data, address)
+        elif kind == 'tcp-server':
+            connection, _ = self.tcp_server.accept()
+            connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+            connection.close()
+        elif kind == 'udp':
+            data = self.udp.recv(64)
+            if len(data) >= UDP_PROBE.size:
+                magic, sequence = UDP_PROBE.unpack_from(data)
+                if magic == UDP_MAGIC:
+                    self.answer('udp', sequence)
+        elif kind == 'icmp':
+            data = self.icmp.recv(2048)
+            offset = (data[0] & 0x0f) * 4  # Raw sockets include the IP header
+            if len(data) >= offset + 12:
+                icmp_type, _, _, icmp_id, _, sequence = struct.unpack_from('!BBHHHI', data, offset)
+                if icmp_type == 0 and icmp_id == self.icmp_id:
+                    self.answer('icmp', sequence)
+        else:
+            _, sequence = kind
+            sock = key.fileobj
+            self.selector.unregister(sock)
+            # Connected (and maybe already reset by the responder), or refused by a host
+            # without one: either way the handshake took one round trip
+            if sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) in (0, errno.ECONNRESET, errno.ECONNREFUSED):
+                self.answer('tcp', sequence)
+            sock.close()
+
+    def expire(self, now):
+        """Count probes unanswered for PROBE_TIMEOUT as lost"""
+        cutoff = now - int(PROBE_TIMEOUT * 10**9)
+        for key, (target, sent_ns) in list(self.outstanding.items()):
+            if sent_ns < cutoff:
+                del self.outstanding[key]
+                self.results[(target, key[0])][1] += 1
+        for key in list(self.selector.get_map().values()):
+            if isinstance(key.data, tuple) and ('tcp', key.data[1]) not in self.outstanding:
+                self.selector.unregister(key.fileobj)
+                key.fileobj.close()
+
+    def report(self):
+        """Print this interval's results as JSON lines and start a new interval"""
+        for (target, protocol), (sent, lost, histogram) in self.results.items():
+            if sent:
+                print(json.dumps({'target': target, 'protocol': protocol, 'sent': sent, 'lost': lost,
+                                  'histogram': histogram.counts}))
+            self.results[(target, protocol)] = [0, 0, LatencyHistogram()]
+        sys.stdout.flush()
+
+    def run(self):
+        now = time.monotonic_ns()
+        next_send = now
+        next_report = now + int(self.report_interval * 10**9)
+        while self.running:
+            deadline = min(next_report, next_send if self.gap_ns else next_report)
+            for key, _ in self.selector.select(max(0, deadline - time.monotonic_ns()) / 10**9):
+                try:
+                    self.handle(key)
+                except OSError:
+                    pass
+            now = time.monotonic_ns()
+            if self.gap_ns:
+                if now - next_send > 10**9:
+                    next_send = now  # Fell behind by more than a second; do not burst
+                while next_send <= now:
+                    self.send(*next(self.schedule))
+                    next_send += self.gap_ns
+            if now >= next_report:
+                self.expire(now)
+                self.report()
+                next_report += int(self.report_interval * 10**9)
+        self.expire(time.monotonic_ns())
+        self.report()
+
+    def stop(self, *_):
+        self.running = False
+
+class LatencyProbers:
+    """One latency_prober process per host, started through node.popen, with a single
+    thread that reads every process's reports and passes each one to
+    on_report(source host, target host, protocol, sent, lost, histogram)."""
+    def __init__(self, hosts, pairs, on_report, rate=20, protocols=PROBE_PROTOCOLS, report_interval=5.0):
+        self.hosts = list(hosts)
+        self.on_report = on_report
+        self.rate = rate
+        self.protocols = list(protocols)
+        self.report_interval = report_interval
+        self.targets = {host.name: [] for host in self.hosts}
+        for source, target in pairs:
+            self.targets[source.name].append(target)
+        self.names = {host.IP(): host.name for host in self.hosts}
+        self.processes = {}  # host name -> Popen
+        self.buffers = {}    # host name -> bytes of an incomplete report line
+        self.selector = selectors.DefaultSelector()
+        self.thread = None
+
+    def start(self):
+        # Every host runs a process, since every host has to answer probes
+        for host in self.hosts:
+            args = [sys.executable, os.path.abspath(__file__), '--rate', str(self.rate),
+                    '--interval', str(self.report_interval), '--protocols'] + self.protocols
+            targets = [target.IP() for target in self.targets[host.name]]
+            if targets:
+                args += ['--targets'] + targets
+            process = host.popen(args, stdout=subprocess.PIPE, stderr=None)
+            self.processes[host.name] = process
+            self.selector.register(process.stdout, selectors.EVENT_READ, host.name)
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+        print(f"Latency probers started on {len(self.processes)} hosts "
+              f"({self.rate} Hz per target over {', '.join(self.protocols)})")
+
+    def run(self):
+        while self.selector.get_map():
+            for key, _ in self.selector.select(timeout=1.0):
+                data = os.read(key.fileobj.fileno(), 1 << 16)
+                if not data:
+                    self.selector.unregister(key.fileobj)  # Process exited
+                    continue
+                *lines, self.buffers[key.data] = (self.buffers.get(key.data, b'') + data).split(b'\n')
+                for line in lines:
+                    try:
+                        report = json.loads(line)
+                        self.on_report(key.data, self.names.get(report['target'], report['target']),
+                                       report['protocol'], report['sent'], report['lost'],
+                                       LatencyHistogram(report['histogram']))
+                    except (ValueError, KeyError) as e:
+                        print(f"Bad latency report from {key.data}: {e}")
+
+    def stop(self):
+        """Stop every prober; each one prints its last partial interval first"""
+        for process in self.processes.values():
+            try:
+                process.send_signal(signal.SIGTERM)
+            except OSError:
+                pass
+        for name, process in self.processes.items():
+            try:
+                process.wait(timeout=PROBE_TIMEOUT + 2)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if self.thread:
+            self.thread.join(timeout=2)
+        print("Latency probers stopped")
+
+def main():
+    parser = argparse.ArgumentParser(description='Answer latency probes and probe the given targets')
+    parser.add_argument('--targets', nargs='*', default=[], help='Target IP addresses')
+    parser.add_argument('--rate', type=float, default=20, help='Probes per second per target and protocol')
+    parser.add_argument('--protocols', nargs='+', choices=PROBE_PROTOCOLS, default=list(PROBE_PROTOCOLS))
+    parser.add_argument('--interval', type=float, default=5.0, help='Seconds between reports')
+    args = parser.parse_args()
+
+    prober = Prober(args.targets, args.rate, args.protocols, args.interval)
+    signal.signal(signal.SIGTERM, prober.stop)
+    signal.signal(signal.SIGINT, prober.stop)
+    prober.run()
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,15 @@
 from mininet.net import Mininet
-from mininet.topo import Topo
+from mininet.topo import Topo, SingleSwitchTopo
 from mininet.node import OVSSwitch, Controller, RemoteController
 from mininet.cli import CLI
 from mininet.log import setLogLevel
 from mininet.link import TCLink
 from mininet.util import dumpNodeConnections
 import os
+import time
+import argparse
 from time import sleep
+from net_setup import push_flow_rules, provision_qos, populate_arp, StartupTimer, wait_connected
 
 class ExpandedQoSTopoOF13(Topo):
     def build(self):
@@ -39,55 +42,39 @@ class ExpandedQoSTopoOF13(Topo):
         self.addLink(s3, s4, cls=TCLink, bw=20, delay='2ms', loss=0)
         self.addLink(s1, s4, cls=TCLink, bw=20, delay='2ms', loss=0)  # Alternative path
 
-def configure_switch_of13(switch):
-    """Configure switch to use OpenFlow 1.3"""
-    print(f"Configuring {switch.name} for OpenFlow 1.3")
-    
-    # Set OpenFlow 1.3
-    switch.cmd('ovs-vsctl set Bridge', switch, 'protocols=OpenFlow13')
-    
-    # Clear existing QoS configurations
-    for port in range(1, 5):  # Support up to 4 ports per switch
-        switch.cmd(f'ovs-vsctl clear Port {switch.name}-eth{port} qos')
-    
-    # Configure QoS for each port
-    for port in range(1, 5):
-        switch.cmd(f'ovs-vsctl -- set Port {switch.name}-eth{port} qos=@newqos -- \
-                  --id=@newqos create QoS type=linux-htb \
-                  queues=0=@q0,1=@q1,2=@q2 -- \
-                  --id=@q0 create Queue other-config:max-rate=1000000 -- \
-                  --id=@q1 create Queue other-config:min-rate=5000000 -- \
-                  --id=@q2 create Queue other-config:min-rate=3000000')
+# Queues configured on every switch port: queue id -> Queue other-config
+QOS_QUEUES = {
+    0: {'max-rate': 1000000},
+    1: {'min-rate': 5000000},
+    2: {'min-rate': 3000000},
+}
 
-def add_openflow_rules(switch):
-    """Add OpenFlow rules to the switch"""
-    print(f"\nAdding OpenFlow rules to {switch.name}")
-    
-    # Clear existing flows
-    switch.cmd('ovs-ofctl -O OpenFlow13 del-flows', switch)
-    
-    # Add table-miss flow entry
-    switch.cmd('ovs-ofctl -O OpenFlow13 add-flow', switch, 
-              'table=0,priority=0,actions=CONTROLLER:65535')
+def configure_switches_of13(switches):
+    """Configure switches to use OpenFlow 1.3 with QoS on all of their ports"""
+    print(f"Configuring {', '.join(switch.name for switch in switches)} for OpenFlow 1.3")
+    provision_qos(switches, QOS_QUEUES)
+
+# Flow table installed on every switch
+FLOW_RULES = [
+    # Table-miss flow entry
+    'table=0,priority=0,actions=CONTROLLER:65535',
     
-    # Add MAC learning flows
-    switch.cmd('ovs-ofctl -O OpenFlow13 add-flow', switch,
-              'table=0,priority=1,arp,actions=FLOOD')
-    switch.cmd('ovs-ofctl -O OpenFlow13 add-flow', switch,
-              'table=0,priority=1,icmp,actions=FLOOD')
+    # MAC learning flows
+    'table=0,priority=1,arp,actions=FLOOD',
+    'table=0,priority=1,icmp,actions=FLOOD',
     
     # QoS rules for different traffic types with explicit forwarding
-    switch.cmd('ovs-ofctl -O OpenFlow13 add-flow', switch,
-              'priority=100,ip,nw_proto=1,actions=set_queue:2,FLOOD')  # ICMP
-    switch.cmd('ovs-ofctl -O OpenFlow13 add-flow', switch,
-              'priority=90,tcp,actions=set_queue:1,FLOOD')  # TCP
-    switch.cmd('ovs-ofctl -O OpenFlow13 add-flow', switch,
-              'priority=80,udp,actions=set_queue:0,FLOOD')  # UDP
-    
-    print("\nVerifying flows:")
-    print(switch.cmd('ovs-ofctl -O OpenFlow13 dump-flows', switch))
+    'priority=100,ip,nw_proto=1,actions=set_queue:2,FLOOD',  # ICMP
+    'priority=90,tcp,actions=set_queue:1,FLOOD',  # TCP
+    'priority=80,udp,actions=set_queue:0,FLOOD',  # UDP
+]
+
+def add_openflow_rules(switches):
+    """Add OpenFlow rules to all switches at once"""
+    print(f"\nAdding OpenFlow rules to {', '.join(switch.name for switch in switches)}")
+    push_flow_rules(switches, FLOW_RULES)
 
-def setup_network():
+def setup_network(timer):
     """Create and configure the network"""
     topo = ExpandedQoSTopoOF13()
     net = Mininet(
@@ -98,23 +85,23 @@ def setup_network():
         autoSetMacs=True
     )
     
-    net.start()
+    with timer.phase('start'):
+        net.start()
     
-    # Wait for network to initialize
-    print("Waiting for network to initialize...")
-    sleep(2)
+    # Wait until the switches reach the controller
+    with timer.phase('controller connect'):
+        wait_connected(net)
     
-    # Configure switches
-    for switch in net.switches:
-        configure_switch_of13(switch)
-        add_openflow_rules(switch)
+    # Configure switches: QoS in one ovsdb transaction, flows on all switches at once
+    with timer.phase('switch config'):
+        configure_switches_of13(net.switches)
+    with timer.phase('flow install'):
+        add_openflow_rules(net.switches)
     
     # Ensure all hosts can see each other by updating ARP tables
-    print("\nUpdating ARP tables...")
-    for h1 in net.hosts:
-        for h2 in net.hosts:
-            if h1 != h2:
-                h1.cmd(f'arp -s {h2.IP()} {h2.MAC()}')
+    with timer.phase('static ARP'):
+        print("\nUpdating ARP tables...")
+        populate_arp(net.hosts)
     
     return net
 
@@ -161,15 +148,55 @@ def test_expanded_network(net):
     h4.cmd('kill %iperf')
     h6.cmd('kill %iperf')
 
+def benchmark_arp(host_counts=(10, 50, 100)):
+    """Time static ARP population with one arp -s per entry against one ip -batch per host"""
+    results = []
+    for count in host_counts:
+        print(f"\nBuilding a single-switch network with {count} hosts...")
+        net = Mininet(topo=SingleSwitchTopo(k=count), switch=OVSSwitch, controller=None,
+                      autoSetMacs=True)
+        net.start()
+        try:
+            timings = []
+            for batched in (False, True):
+                for host in net.hosts:
+                    host.cmd(f'ip neigh flush dev {host.defaultIntf()} nud all')
+                start = time.perf_counter()
+                populate_arp(net.hosts, batched=batched)
+                timings.append(time.perf_counter() - start)
+            results.append((count, *timings))
+        finally:
+            net.stop()
+
+    print(f"\n{'Hosts':>6} {'Entries':>8} {'arp -s (s)':>11} {'ip -batch (s)':>14} {'Speedup':>8}")
+    for count, per_entry, batched in results:
+        print(f"{count:>6} {count * (count - 1):>8} {per_entry:>11.3f} {batched:>14.3f} "
+              f"{per_entry / batched:>7.1f}x")
+
 def main():
+    parser = argparse.ArgumentParser(description='Expanded QoS network with OpenFlow 1.3')
+    parser.add_argument('--bench-arp', action='store_true',
+                        help='Benchmark static ARP population at 10/50/100 hosts and exit')
+    args = parser.parse_args()
+    
     setLogLevel('info')
+    timer = StartupTimer()
     
     # Clean up any previous run
-    os.system('mn -c')
-    os.system('killall controller')
+    with timer.phase('cleanup'):
+        os.system('mn -c')
+        os.system('killall controller')
+    
+    if args.bench_arp:
+        setLogLevel('warning')
+        benchmark_arp()
+        return
     
     print("Starting expanded QoS network with OpenFlow 1.3")
-    net = setup_network()
+    with timer.trace_commands():
+        net = setup_network(timer)
+    timer.report()
+    timer.write_trace()
     
     print("\nNetwork is ready")
     test_expanded_network(net)
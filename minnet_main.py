@@ -7,6 +7,7 @@ from mininet.link import TCLink
 from mininet.util import dumpNodeConnections
 import os
 from time import sleep
+from net_setup import push_flow_rules, provision_qos, StartupTimer, wait_connected
 
 class QoSTopoOF13(Topo):
     def build(self):
@@ -19,53 +20,35 @@ class QoSTopoOF13(Topo):
         self.addLink(h1, s1, cls=TCLink, bw=10, delay='5ms', loss=1)
         self.addLink(h2, s1, cls=TCLink, bw=10, delay='5ms', loss=1)
 
-def configure_switch_of13(switch):
-    """Configure switch to use OpenFlow 1.3"""
-    print(f"Configuring {switch.name} for OpenFlow 1.3")
-    
-    # Set OpenFlow 1.3
-    switch.cmd('ovs-vsctl set Bridge', switch, 'protocols=OpenFlow13')
-    
-    # Configure QoS
-    switch.cmd('ovs-vsctl clear Port %s-eth1 qos' % switch.name)
-    switch.cmd('ovs-vsctl clear Port %s-eth2 qos' % switch.name)
-    
-    switch.cmd('ovs-vsctl -- set Port %s-eth1 qos=@newqos -- \
-              --id=@newqos create QoS type=linux-htb \
-              queues=0=@q0,1=@q1,2=@q2 -- \
-              --id=@q0 create Queue other-config:max-rate=1000000 -- \
-              --id=@q1 create Queue other-config:min-rate=5000000 -- \
-              --id=@q2 create Queue other-config:min-rate=3000000' % switch.name)
-    
-    switch.cmd('ovs-vsctl -- set Port %s-eth2 qos=@newqos -- \
-              --id=@newqos create QoS type=linux-htb \
-              queues=0=@q0,1=@q1,2=@q2 -- \
-              --id=@q0 create Queue other-config:max-rate=1000000 -- \
-              --id=@q1 create Queue other-config:min-rate=5000000 -- \
-              --id=@q2 create Queue other-config:min-rate=3000000' % switch.name)
+# Queues configured on every switch port: queue id -> Queue other-config
+QOS_QUEUES = {
+    0: {'max-rate': 1000000},
+    1: {'min-rate': 5000000},
+    2: {'min-rate': 3000000},
+}
 
-def add_openflow_rules(switch):
-    """Add OpenFlow rules to the switch"""
-    print(f"\nAdding OpenFlow rules to {switch.name}")
-    
-    # Clear existing flows
-    switch.cmd('ovs-ofctl -O OpenFlow13 del-flows', switch)
-    
-    # Add basic forwarding rules for all traffic
-    switch.cmd('ovs-ofctl -O OpenFlow13 add-flow', switch, 'priority=0,actions=NORMAL')
-    
-    # Add specific rules for different traffic types
-    switch.cmd('ovs-ofctl -O OpenFlow13 add-flow', switch, 
-              'priority=100,ip,nw_proto=1,actions=set_queue:2,NORMAL')  # ICMP
-    switch.cmd('ovs-ofctl -O OpenFlow13 add-flow', switch, 
-              'priority=90,tcp,actions=set_queue:1,NORMAL')  # TCP
-    switch.cmd('ovs-ofctl -O OpenFlow13 add-flow', switch, 
-              'priority=80,udp,actions=set_queue:0,NORMAL')  # UDP
-    
-    print("\nVerifying flows:")
-    print(switch.cmd('ovs-ofctl -O OpenFlow13 dump-flows', switch))
+def configure_switches_of13(switches):
+    """Configure switches to use OpenFlow 1.3 with QoS on all of their ports"""
+    print(f"Configuring {', '.join(switch.name for switch in switches)} for OpenFlow 1.3")
+    provision_qos(switches, QOS_QUEUES)
 
-def setup_network():
+# Flow table installed on every switch
+FLOW_RULES = [
+    # Basic forwarding rule for all traffic
+    'priority=0,actions=NORMAL',
+    
+    # Specific rules for different traffic types
+    'priority=100,ip,nw_proto=1,actions=set_queue:2,NORMAL',  # ICMP
+    'priority=90,tcp,actions=set_queue:1,NORMAL',  # TCP
+    'priority=80,udp,actions=set_queue:0,NORMAL',  # UDP
+]
+
+def add_openflow_rules(switches):
+    """Add OpenFlow rules to all switches at once"""
+    print(f"\nAdding OpenFlow rules to {', '.join(switch.name for switch in switches)}")
+    push_flow_rules(switches, FLOW_RULES)
+
+def setup_network(timer):
     "Create network and configure OpenFlow rules"
     topo = QoSTopoOF13()
     
@@ -77,16 +60,18 @@ def setup_network():
         autoSetMacs=True
     )
     
-    net.start()
+    with timer.phase('start'):
+        net.start()
     
-    # Wait for network to initialize
-    print("Waiting for network to initialize...")
-    sleep(2)
+    # Wait until the switches reach the controller
+    with timer.phase('controller connect'):
+        wait_connected(net)
     
-    # Configure switches
-    for switch in net.switches:
-        configure_switch_of13(switch)
-        add_openflow_rules(switch)
+    # Configure switches: QoS in one ovsdb transaction, flows on all switches at once
+    with timer.phase('switch config'):
+        configure_switches_of13(net.switches)
+    with timer.phase('flow install'):
+        add_openflow_rules(net.switches)
     
     return net
 
@@ -125,13 +110,18 @@ def test_network(net):
 
 def main():
     setLogLevel('info')
+    timer = StartupTimer()
     
     # Clean up any previous run
-    os.system('mn -c')
-    os.system('killall controller')
+    with timer.phase('cleanup'):
+        os.system('mn -c')
+        os.system('killall controller')
     
     print("Starting QoS network with OpenFlow 1.3")
-    net = setup_network()
+    with timer.trace_commands():
+        net = setup_network(timer)
+    timer.report()
+    timer.write_trace()
     
     print("\nNetwork is ready")
     test_network(net)
@@ -0,0 +1,404 @@
+"""
+Shared helpers for bringing up the QoS test networks.
+
+Flow rule sets are plain lists of ovs-ofctl flow specs. push_flow_rules pushes a
+whole set to many switches at once, from one file with a single ovs-ofctl process per
+switch, as an atomic bundle when the switch supports it. install_flow_rules is the
+one add-flow process per rule baseline it replaced, kept for the startup benchmark.
+
+StartupTimer records how long each bring-up phase takes and, inside
+trace_commands(), every Node.cmd and run_commands call with its node, command and duration. The
+result can be written as a Chrome trace (chrome://tracing, Perfetto, speedscope)
+with one track for the phases and one per node.
+
+run_commands runs shell commands on many nodes at once. It is built on Node.sendCmd
+and an asyncio reader on each node's shell, so commands to different nodes overlap,
+commands to the same node keep their order, and each one has its own timeout; a
+fan-out takes as long as its slowest node rather than the sum of all of them.
+
+provision_qos reads the bridges' real ports and the current QoS/Queue rows from
+ovsdb, and applies only the differences from the desired queue configuration in one
+ovs-vsctl transaction, destroying QoS and Queue rows that nothing references.
+read_queue_stats reads the counters of those queues from all switches in one pass.
+"""
+import os
+import re
+import json
+import asyncio
+import time
+import tempfile
+import subprocess
+from collections import defaultdict
+from contextlib import contextmanager
+from mininet.node import Node
+
+OFCTL = 'ovs-ofctl -O OpenFlow13'
+VSCTL = 'ovs-vsctl'
+SWITCH_CONNECT_TIMEOUT = 10  # seconds to wait for switches to reach the controller
+NODE_CMD_TIMEOUT = 30        # seconds a command run through run_commands may take
+NODE_INTERRUPT_TIMEOUT = 2   # seconds a timed-out command gets to exit after Ctrl-C
+# One queue of `ovs-ofctl queue-stats`, e.g. "port 1 queue 0: bytes=0, pkts=0, errors=0, duration=3.479s".
+# Counters the datapath does not track are printed as "?"; duration is only in OpenFlow 1.3+ replies.
+QUEUE_STATS_LINE = re.compile(r'port\s+(\S+)\s+queue\s+(\d+):\s*bytes=(\d+|\?),\s*pkts=(\d+|\?),'
+                              r'\s*errors=(\d+|\?)(?:,\s*duration=([\d.]+)s)?')
+
+# Called with (node, command, start, duration) for every command run_commands completes;
+# StartupTimer.trace_commands registers itself here
+command_tracers = []
+
+async def shell_cmd(node, command, timeout=NODE_CMD_TIMEOUT):
+    """Run a command in the node's shell without blocking the event loop.
+    The shell prompt marks the end of the output, exactly as in Node.cmd; on timeout the
+    command is interrupted and TimeoutError raised."""
+    loop = asyncio.get_running_loop()
+    readable = asyncio.Event()
+    fd = node.stdout.fileno()
+    output = []
+    loop.add_reader(fd, readable.set)
+    try:
+        node.sendCmd(command)
+        deadline = loop.time() + timeout
+        while node.waiting:
+            try:
+                await asyncio.wait_for(readable.wait(), max(0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                break
+            readable.clear()
+            # monitor() strips the pid marker and clears node.waiting at the prompt
+            output.append(node.monitor(timeoutms=0))
+        if node.waiting:
+            node.sendInt()
+            deadline = loop.time() + NODE_INTERRUPT_TIMEOUT
+            while node.waiting and loop.time() < deadline:
+                try:
+                    await asyncio.wait_for(readable.wait(), max(0, deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    break
+                readable.clear()
+                node.monitor(timeoutms=0)
+            raise TimeoutError(f"{node.name}: {command!r} took longer than {timeout}s")
+    finally:
+        loop.remove_reader(fd)
+    return ''.join(output)
+
+def run_commands(jobs, timeout=NODE_CMD_TIMEOUT):
+    """Run (node, command) jobs concurrently across nodes, in order on each node.
+    Returns the outputs in job order, with the exception in place of the output of a
+    job that failed or timed out. Must not be mixed with Node.cmd on the same nodes
+    from other threads while it runs."""
+    jobs = list(jobs)
+    if not jobs:
+        return []
+
+    async def run_all():
+        locks = defaultdict(asyncio.Lock)
+
+        async def run(node, command):
+            async with locks[node.name]:
+                start = time.perf_counter()
+                try:
+                    return await shell_cmd(node, command, timeout)
+                finally:
+                    for tracer in command_tracers:
+                        tracer(node, command, start, time.perf_counter() - start)
+
+        return await asyncio.gather(*(run(node, command) for node, command in jobs),
+                                    return_exceptions=True)
+
+    return asyncio.run(run_all())
+
+
+def install_flow_rules(switch, rules, verify=True):
+    """Replace the switch's flow table with rules, one ovs-ofctl process per rule.
+    This is the old path, kept for comparison; use push_flow_rules otherwise."""
+    switch.cmd(OFCTL, 'del-flows', switch)
+    for rule in rules:
+        switch.cmd(OFCTL, 'add-flow', switch, rule)
+
+    if verify:
+        print(f"\nVerifying flows on {switch.name}:")
+        print(switch.cmd(OFCTL, 'dump-flows', switch))
+
+def push_flow_rules(switches, rules, verify=True):
+    """Replace the flow table of every switch with the same rules, all switches at once:
+    one bundled replace-flows per switch, issued together through run_commands.
+    replace-flows swaps the whole table in one process; --bundle makes the swap atomic,
+    so a switch never runs with a partial rule set."""
+    switches = list(switches)
+    fd, path = tempfile.mkstemp(prefix='flows-', suffix='.txt')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write('\n'.join(rules) + '\n')
+        outputs = run_commands((switch, f'{OFCTL} --bundle replace-flows {switch.name} {path}; echo "rc=$?"')
+                               for switch in switches)
+        failed = [switch for switch, output in zip(switches, outputs)
+                  if isinstance(output, Exception) or not output.rstrip().endswith('rc=0')]
+        for switch in failed:
+            print(f"Bundle install failed on {switch.name}, retrying without --bundle")
+        for switch, output in zip(failed, run_commands((switch, f'{OFCTL} replace-flows {switch.name} {path}')
+                                                       for switch in failed)):
+            if isinstance(output, Exception):
+                print(f"Flow install failed on {switch.name}: {output}")
+    finally:
+        os.remove(path)
+
+    if verify:
+        for switch, output in zip(switches, run_commands((switch, f'{OFCTL} dump-flows {switch.name}')
+                                                         for switch in switches)):
+            print(f"\nVerifying flows on {switch.name}:")
+            print(output)
+
+def populate_arp(hosts, batched=True):
+    """Give every host a permanent neighbor entry for every other host.
+    Batched, each host loads its whole table with one 'ip -batch' and all hosts do
+    so at once; otherwise one 'arp -s' per entry, as before, for comparison."""
+    hosts = list(hosts)
+    if not batched:
+        for h1 in hosts:
+            for h2 in hosts:
+                if h1 != h2:
+                    h1.cmd(f'arp -s {h2.IP()} {h2.MAC()}')
+        return
+
+    # Build the neighbor set once; each host skips only its own entry
+    neighbors = [(host.name, host.IP(), host.MAC()) for host in hosts]
+
+    paths = []
+    try:
+        for host in hosts:
+            intf = host.defaultIntf().name
+            fd, path = tempfile.mkstemp(prefix=f'{host.name}-neigh-', suffix='.batch')
+            paths.append(path)
+            with os.fdopen(fd, 'w') as f:
+                for name, ip, mac in neighbors:
+                    if name != host.name:
+                        f.write(f'neigh replace {ip} lladdr {mac} dev {intf} nud permanent\n')
+        # Every host loads its table at the same time
+        for host, output in zip(hosts, run_commands((host, f'ip -batch {path}')
+                                                    for host, path in zip(hosts, paths))):
+            if isinstance(output, Exception) or output.strip():
+                print(f"ip -batch on {host.name}: {str(output).strip()}")
+    finally:
+        for path in paths:
+            os.remove(path)
+
+class StartupTimer:
+    """Wall-clock time of each network bring-up phase and of each node command"""
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.phases = []
+        self.events = []   # (name, category, track, start, duration, args)
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.phases.append((name, elapsed))
+            self.events.append((name, 'phase', 'phases', start, elapsed, {}))
+
+    @contextmanager
+    def trace_commands(self):
+        """Record every Node.cmd and run_commands call while active"""
+        original = Node.cmd
+
+        def timed_cmd(node, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(node, *args, **kwargs)
+            finally:
+                self.record_command(node, ' '.join(str(arg) for arg in args), start,
+                                    time.perf_counter() - start)
+
+        Node.cmd = timed_cmd
+        command_tracers.append(self.record_command)
+        try:
+            yield
+        finally:
+            Node.cmd = original
+            command_tracers.remove(self.record_command)
+
+    def record_command(self, node, command, start, duration):
+        # list.append is atomic, so nodes configured from worker threads are safe
+        self.events.append((' '.join(command.split()[:2]), 'cmd', node.name, start, duration,
+                            {'command': command}))
+
+    def report(self, title='Startup time by phase', top=5):
+        total = sum(elapsed for _, elapsed in self.phases)
+        print(f"\n{title}:")
+        for name, elapsed in self.phases:
+            share = 100 * elapsed / total if total else 0
+            print(f"  {name:<20} {elapsed:8.3f}s {share:5.1f}%")
+        print(f"  {'total':<20} {total:8.3f}s")
+
+        commands = defaultdict(lambda: [0, 0.0])
+        for name, category, _, _, duration, _ in self.events:
+            if category == 'cmd':
+                commands[name][0] += 1
+                commands[name][1] += duration
+        if commands:
+            calls = sum(count for count, _ in commands.values())
+            print(f"  {calls} node commands; slowest by total time:")
+            for name, (count, elapsed) in sorted(commands.items(), key=lambda item: -item[1][1])[:top]:
+                print(f"    {name:<30} {count:6d} calls {elapsed:8.3f}s")
+        return total
+
+    def write_trace(self, path='startup_trace.json'):
+        """Write the phases and commands in Chrome trace event format"""
+        tracks = {'phases': 0}
+        trace = []
+        for name, category, track, start, duration, args in self.events:
+            trace.append({'name': name, 'cat': category, 'ph': 'X', 'pid': 1,
+                          'tid': tracks.setdefault(track, len(tracks)),
+                          'ts': (start - self.origin) * 1e6, 'dur': duration * 1e6, 'args': args})
+        trace += [{'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid, 'args': {'name': track}}
+                  for track, tid in tracks.items()]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f)
+        print(f"Startup trace written to {path}")
+
+def wait_connected(net, timeout=SWITCH_CONNECT_TIMEOUT):
+    """Return as soon as every switch is connected to its controller, instead of sleeping"""
+    print("Waiting for switches to connect to the controller...")
+    if not net.waitConnected(timeout=timeout, delay=0.1):
+        print(f"Warning: not all switches connected within {timeout}s")
+
+def ovsdb_value(value):
+    """Decode OVSDB JSON: ["uuid", u] -> u, ["set", [...]] -> list, ["map", [...]] -> dict"""
+    if isinstance(value, list) and len(value) == 2:
+        kind, data = value
+        if kind == 'set':
+            return [ovsdb_value(item) for item in data]
+        if kind == 'map':
+            return {ovsdb_value(key): ovsdb_value(item) for key, item in data}
+        if kind in ('uuid', 'named-uuid'):
+            return data
+    return value
+
+def as_list(value):
+    """OVSDB encodes a one-element set as the bare element"""
+    return value if isinstance(value, list) else [value]
+
+def read_ovsdb(*tables):
+    """List several tables with one ovs-vsctl call.
+    tables are (name, columns) pairs; returns {name: [row dicts]}."""
+    args = [VSCTL, '--format=json']
+    for table, columns in tables:
+        args += ['--', f'--columns={",".join(columns)}', 'list', table]
+    output = subprocess.run(args, capture_output=True, text=True, check=True).stdout
+    # One JSON document per list command, concatenated
+    decoder = json.JSONDecoder()
+    state = {}
+    pos = 0
+    for table, _ in tables:
+        while output[pos].isspace():
+            pos += 1
+        result, pos = decoder.raw_decode(output, pos)
+        state[table] = [dict(zip(result['headings'], map(ovsdb_value, row))) for row in result['data']]
+    return state
+
+def qos_matches(qos, queue_rows, qos_type, queues):
+    """True if an existing QoS row already has exactly the desired queues"""
+    if qos is None or qos['type'] != qos_type or set(qos['queues']) != set(queues):
+        return False
+    return all(queue_rows.get(qos['queues'][queue], {}).get('other_config') == config
+               for queue, config in queues.items())
+
+def provision_qos(switches, queues, qos_type='linux-htb', protocols='OpenFlow13'):
+    """Bring every port of the given switches to the desired QoS in one transaction.
+    queues maps queue id -> {other-config key: value}. Ports that already match are left
+    alone, and QoS/Queue rows no port references any more are destroyed, since both
+    are root tables that ovsdb never garbage-collects."""
+    state = read_ovsdb(('Bridge', ('_uuid', 'name', 'ports', 'protocols')),
+                       ('Port', ('_uuid', 'name', 'qos')),
+                       ('QoS', ('_uuid', 'type', 'queues')),
+                       ('Queue', ('_uuid', 'other_config')))
+    ports = {row['_uuid']: row for row in state['Port']}
+    qos_rows = {row['_uuid']: row for row in state['QoS']}
+    queue_rows = {row['_uuid']: row for row in state['Queue']}
+    queues = {int(queue): {key: str(value) for key, value in config.items()}
+              for queue, config in queues.items()}
+    names = {switch.name for switch in switches}
+
+    commands = []
+    replaced_ports = set()
+    updated = 0
+    for bridge in state['Bridge']:
+        if bridge['name'] not in names:
+            continue
+        if set(as_list(bridge['protocols'])) != {protocols}:
+            commands.append(['set', 'Bridge', bridge['name'], f'protocols={protocols}'])
+        for port_uuid in as_list(bridge['ports']):
+            port = ports[port_uuid]
+            if port['name'] == bridge['name']:
+                continue  # The bridge's own internal port
+            current = as_list(port['qos'])
+            if current and qos_matches(qos_rows.get(current[0]), queue_rows, qos_type, queues):
+                continue
+            replaced_ports.add(port_uuid)
+            commands.append(['set', 'Port', port['name'], f'qos=@qos{updated}'])
+            commands.append([f'--id=@qos{updated}', 'create', 'QoS', f'type={qos_type}'] +
+                            [f'queues:{queue}=@q{updated}_{queue}' for queue in queues])
+            for queue, config in queues.items():
+                commands.append([f'--id=@q{updated}_{queue}', 'create', 'Queue'] +
+                                [f'other-config:{key}={value}' for key, value in config.items()])
+            updated += 1
+
+    # Orphans: rows unreferenced now, plus the rows the ports above stop using.
+    # --if-exists because a concurrent run for other switches may destroy them first.
+    referenced_qos = {uuid for port in state['Port'] if port['_uuid'] not in replaced_ports
+                      for uuid in as_list(port['qos'])}
+    orphan_qos = set(qos_rows) - referenced_qos
+    referenced_queues = {uuid for qos_uuid, qos in qos_rows.items() if qos_uuid not in orphan_qos
+                         for uuid in qos['queues'].values()}
+    orphan_queues = set(queue_rows) - referenced_queues
+    commands += [['--if-exists', 'destroy', 'QoS', uuid] for uuid in sorted(orphan_qos)]
+    commands += [['--if-exists', 'destroy', 'Queue', uuid] for uuid in sorted(orphan_queues)]
+
+    if commands:
+        args = [VSCTL]
+        for command in commands:
+            args += ['--'] + command
+        result = subprocess.run(args, capture_output=True, text=True)
+        if result.returncode != 0:
+            print(f"QoS transaction failed: {result.stderr.strip()}")
+            return None
+    print(f"QoS on {', '.join(sorted(names))}: {updated} port(s) updated, "
+          f"{len(orphan_qos)} QoS and {len(orphan_queues)} Queue orphan row(s) removed")
+    return updated
+
+def parse_queue_stats(output):
+    """{(port, queue id): (tx bytes, tx packets, tx errors, duration in seconds or None)} from
+    `ovs-ofctl queue-stats` output. Ports are OpenFlow port numbers (or names such as LOCAL);
+    unknown counters are 0. For linux-htb queues the errors are the packets the queue dropped."""
+    stats = {}
+    for match in QUEUE_STATS_LINE.finditer(output):
+        port, queue, tx_bytes, tx_packets, errors, duration = match.groups()
+        port = int(port) if port.isdigit() else port
+        counters = tuple(0 if value == '?' else int(value) for value in (tx_bytes, tx_packets, errors))
+        stats[(port, int(queue))] = counters + (float(duration) if duration else None,)
+    return stats
+
+def read_queue_stats(switches, timeout=NODE_CMD_TIMEOUT):
+    """parse_queue_stats of every switch, one ovs-ofctl per switch all started at once; a
+    switch whose ovs-ofctl failed gets its exception instead. popen rather than
+    run_commands keeps a sampling thread out of the switch shells the CLI uses."""
+    processes = [switch.popen(OFCTL.split() + ['queue-stats', switch.name],
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE) for switch in switches]
+    deadline = time.time() + timeout
+    results = []
+    for switch, process in zip(switches, processes):
+        try:
+            output, error = process.communicate(timeout=max(0, deadline - time.time()))
+        except subprocess.TimeoutExpired as e:
+            process.kill()
+            process.communicate()
+            results.append(e)
+            continue
+        if process.returncode != 0:
+            results.append(RuntimeError(error.decode(errors='replace').strip()))
+        else:
+            results.append(parse_queue_stats(output.decode(errors='replace')))
+    return results
@@ -0,0 +1,227 @@
+"""
+SQLite store for the NetworkStats monitoring samples.
+
+Samples are kept in typed columns instead of CSV text: the timestamp as int64 epoch
+nanoseconds, the link as an interned integer id (the links table maps ids to names
+such as h1-s1) and the counters as integers or floats. Each table has an index on
+(link_id, ts_ns), so selecting a time range of a few links reads only those rows,
+and one on ts_ns for time ranges over all links. A StatsStore starts empty, like the
+CSV files it replaces; pass reset=False to keep adding to an earlier run's samples.
+
+The database runs in WAL mode: one writer thread inserts queued samples in batched
+transactions while readers query it at the same time. export_csv writes the original
+traffic_stats.csv, bandwidth.csv, latency.csv and queue_stats.csv from the database.
+
+Run as a script to query or export a database, e.g.
+    python stats_store.py network_stats/network_stats.db --link h1-s1 --start 2024-05-01T10:00
+    python stats_store.py network_stats/network_stats.db --export network_stats
+"""
+import os
+import csv
+import time
+import queue
+import sqlite3
+import argparse
+import threading
+from datetime import datetime
+
+DB_NAME = 'network_stats.db'
+
+# Sample tables: name -> (value columns with their SQL types, CSV file, CSV header)
+TABLES = {
+    'traffic': ([('bytes_sent', 'INTEGER'), ('bytes_recv', 'INTEGER'),
+                 ('packets_sent', 'INTEGER'), ('packets_recv', 'INTEGER')],
+                'traffic_stats.csv',
+                ['timestamp', 'link', 'bytes_sent', 'bytes_recv', 'packets_sent', 'packets_recv']),
+    'bandwidth': ([('bandwidth_mbps', 'REAL')], 'bandwidth.csv', ['timestamp', 'link', 'bandwidth_mbps']),
+    'latency': ([('latency_ms', 'REAL')], 'latency.csv', ['timestamp', 'link', 'latency_ms']),
+    # Switch egress queues; the link is switch-peer and violation is '', 'min-rate' or 'max-rate'
+    'queue': ([('queue_id', 'INTEGER'), ('tx_bytes', 'INTEGER'), ('tx_packets', 'INTEGER'),
+               ('drops', 'INTEGER'), ('throughput_mbps', 'REAL'), ('violation', 'TEXT')],
+              'queue_stats.csv',
+              ['timestamp', 'link', 'queue_id', 'tx_bytes', 'tx_packets', 'drops', 'throughput_mbps', 'violation']),
+}
+
+class StatsStore:
+    """Monitoring samples in SQLite. add() only queues a sample; a background thread
+    writes a batch once batch_size samples are queued or flush_interval seconds passed.
+    With reset, samples of earlier runs are deleted first, as the CSV files were truncated."""
+    def __init__(self, path, batch_size=500, flush_interval=1.0, reset=True):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.links = {}  # link name -> id
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+
+        connection = self.connect()
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('CREATE TABLE IF NOT EXISTS links (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL)')
+        for table, (columns, _, _) in TABLES.items():
+            values = ', '.join(f'{name} {kind}' for name, kind in columns)
+            connection.execute(f'CREATE TABLE IF NOT EXISTS {table} '
+                               f'(ts_ns INTEGER NOT NULL, link_id INTEGER NOT NULL, {values})')
+            connection.execute(f'CREATE INDEX IF NOT EXISTS {table}_link_ts ON {table} (link_id, ts_ns)')
+            # Time ranges over all links
+            connection.execute(f'CREATE INDEX IF NOT EXISTS {table}_ts ON {table} (ts_ns)')
+            if reset:
+                connection.execute(f'DELETE FROM {table}')
+        if reset:
+            connection.execute('DELETE FROM links')
+        connection.commit()
+        # Without reset, links of an earlier run keep their ids
+        self.links = dict(connection.execute('SELECT name, id FROM links'))
+        connection.close()
+
+        self.writer_thread = threading.Thread(target=self.run)
+        self.writer_thread.daemon = True
+        self.writer_thread.start()
+
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        # WAL is durable enough at NORMAL and avoids an fsync per transaction
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def link_id(self, name):
+        """Interned id of a link name; new links are inserted by the writer"""
+        with self.lock:
+            link = self.links.get(name)
+            if link is None:
+                link = self.links[name] = len(self.links) + 1
+                self.queue.put(('links', (link, name)))
+            return link
+
+    def add(self, table, ts_ns, link, values):
+        """Queue one sample of a TABLES table; never blocks on disk I/O"""
+        self.queue.put((table, (ts_ns, self.link_id(link)) + tuple(values)))
+
+    def run(self):
+        connection = self.connect()
+        inserts = {'links': 'INSERT OR IGNORE INTO links (id, name) VALUES (?, ?)'}
+        for table, (columns, _, _) in TABLES.items():
+            inserts[table] = f'INSERT INTO {table} VALUES ({", ".join("?" * (len(columns) + 2))})'
+        running = True
+        while running:
+            batch = []
+            deadline = time.time() + self.flush_interval
+            # Collect samples until the batch is full or the flush interval is over
+            while len(batch) < self.batch_size:
+                try:
+                    item = self.queue.get(timeout=max(0, deadline - time.time()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    running = False
+                    self.queue.task_done()
+                    break
+                batch.append(item)
+            self.write_batch(connection, inserts, batch)
+        connection.close()
+
+    def write_batch(self, connection, inserts, batch):
+        rows = {table: [] for table in inserts}
+        for table, row in batch:
+            rows[table].append(row)
+        try:
+            # One transaction per batch; links first so every sample's link exists
+            with connection:
+                for table, table_rows in rows.items():
+                    if table_rows:
+                        connection.executemany(inserts[table], table_rows)
+        except sqlite3.Error as e:
+            print(f"Error writing {len(batch)} samples to {self.path}: {e}")
+        for _ in batch:
+            self.queue.task_done()
+
+    def flush(self):
+        """Block until every queued sample is in the database"""
+        self.queue.join()
+
+    def close(self):
+        """Write the remaining samples and stop the writer thread"""
+        self.queue.put(None)
+        self.writer_thread.join()
+
+    def query(self, table, start=None, end=None, links=None):
+        """Samples of one table as (ts_ns, link name, values...) rows in time order.
+        start/end are epoch ns (end exclusive); links is a list of link names.
+        Reads through the (link_id, ts_ns) index; call flush() first to include
+        samples that are still queued."""
+        return query(self.path, table, start, end, links)
+
+    def export_csv(self, output_dir):
+        export_csv(self.path, output_dir)
+
+def query(path, table, start=None, end=None, links=None):
+    """StatsStore.query on a database file, without a writer"""
+    if table not in TABLES:
+        raise ValueError(f"Unknown table {table!r}, expected one of {', '.join(TABLES)}")
+    connection = sqlite3.connect(path, timeout=30)
+    try:
+        names = dict(connection.execute('SELECT id, name FROM links'))
+        sql = f'SELECT * FROM {table}'
+        conditions, params = [], []
+        if links is not None:
+            ids = [link_id for link_id, name in names.items() if name in set(links)]
+            conditions.append(f'link_id IN ({", ".join("?" * len(ids))})')
+            params += ids
+        if start is not None:
+            conditions.append('ts_ns >= ?')
+            params.append(start)
+        if end is not None:
+            conditions.append('ts_ns < ?')
+            params.append(end)
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY ts_ns'
+        return [(row[0], names.get(row[1])) + row[2:] for row in connection.execute(sql, params)]
+    finally:
+        connection.close()
+
+def export_csv(path, output_dir, start=None, end=None, links=None):
+    """Write the samples as traffic_stats.csv, bandwidth.csv, latency.csv and queue_stats.csv,
+    in the format NetworkStats writes directly with the CSV backend"""
+    os.makedirs(output_dir, exist_ok=True)
+    for table, (_, filename, header) in TABLES.items():
+        rows = query(path, table, start, end, links)
+        with open(os.path.join(output_dir, filename), 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows([datetime.fromtimestamp(row[0] / 10**9).isoformat()] + list(row[1:])
+                             for row in rows)
+        print(f"Exported {len(rows)} {table} samples to {os.path.join(output_dir, filename)}")
+
+def parse_time(text):
+    """ISO date/time or epoch seconds -> epoch ns"""
+    try:
+        return int(float(text) * 10**9)
+    except ValueError:
+        return int(datetime.fromisoformat(text).timestamp() * 10**9)
+
+def main():
+    parser = argparse.ArgumentParser(description='Query or export a NetworkStats database')
+    parser.add_argument('database', help=f'Path to {DB_NAME}')
+    parser.add_argument('--table', choices=sorted(TABLES), default='bandwidth')
+    parser.add_argument('--link', action='append', dest='links',
+                        help='Link to select, e.g. h1-s1 (repeatable; default all links)')
+    parser.add_argument('--start', type=parse_time, help='Start time (ISO or epoch seconds)')
+    parser.add_argument('--end', type=parse_time, help='End time (ISO or epoch seconds, exclusive)')
+    parser.add_argument('--export', metavar='DIR', help='Write the CSV files to DIR instead')
+    args = parser.parse_args()
+    if not os.path.exists(args.database):
+        parser.error(f'{args.database} does not exist')
+
+    if args.export:
+        export_csv(args.database, args.export, args.start, args.end, args.links)
+        return
+    start = time.perf_counter()
+    rows = query(args.database, args.table, args.start, args.end, args.links)
+    elapsed = time.perf_counter() - start
+    print(','.join(['timestamp', 'link'] + [name for name, _ in TABLES[args.table][0]]))
+    for row in rows:
+        print(','.join([datetime.fromtimestamp(row[0] / 10**9).isoformat()] + [str(value) for value in row[1:]]))
+    print(f"{len(rows)} samples in {elapsed * 1000:.1f} ms")
+
+if __name__ == '__main__':
+    main()
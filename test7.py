@@ -1,5 +1,5 @@
 from mininet.net import Mininet
-from mininet.topo import Topo
+from mininet.topo import Topo, SingleSwitchTopo
 from mininet.node import OVSSwitch, Controller
 from mininet.cli import CLI
 from mininet.log import setLogLevel
@@ -8,32 +8,172 @@ from mininet.util import dumpNodeConnections
 import csv
 from datetime import datetime
 import time
-from time import sleep
 import threading
 import json
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import signal
 import psutil
 import subprocess
 import os
+import queue
+import shutil
+import argparse
+import tempfile
+import glob
+import math
+from array import array
+from bandwidth_analysis import LiveBandwidthMonitor, PROTOCOLS
+from topologies import TopologySpec
+from stats_store import StatsStore, DB_NAME
+from latency_prober import LatencyProbers, LatencyHistogram
+from net_setup import (install_flow_rules, push_flow_rules, run_commands, provision_qos, read_queue_stats,
+                       StartupTimer, wait_connected)
 # ... (Previous NetworkStats and NetworkMonitor classes remain the same) ...
+class CSVWriteBehind:
+    """Queue CSV rows and append them to their files in batches from a background thread.
+    A batch is written once batch_size rows are queued or flush_interval seconds have passed,
+    opening each file once per batch instead of once per row."""
+    def __init__(self, batch_size=500, flush_interval=1.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue()
+        self.writer_thread = threading.Thread(target=self.run)
+        self.writer_thread.daemon = True
+        self.writer_thread.start()
+
+    def write(self, path, row):
+        """Queue one row for path; never blocks on disk I/O"""
+        self.queue.put((path, row))
+
+    def run(self):
+        running = True
+        while running:
+            batch = []
+            deadline = time.time() + self.flush_interval
+            # Collect rows until the batch is full or the flush interval is over
+            while len(batch) < self.batch_size:
+                try:
+                    item = self.queue.get(timeout=max(0, deadline - time.time()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    running = False
+                    self.queue.task_done()
+                    break
+                batch.append(item)
+            self.write_batch(batch)
+
+    def write_batch(self, batch):
+        rows_by_path = defaultdict(list)
+        for path, row in batch:
+            rows_by_path[path].append(row)
+        for path, rows in rows_by_path.items():
+            try:
+                with open(path, 'a', newline='') as f:
+                    csv.writer(f).writerows(rows)
+            except Exception as e:
+                print(f"Error writing {len(rows)} rows to {path}: {e}")
+        for _ in batch:
+            self.queue.task_done()
+
+    def flush(self):
+        """Block until every queued row is on disk"""
+        self.queue.join()
+
+    def close(self):
+        """Write the remaining rows and stop the writer thread"""
+        self.queue.put(None)
+        self.writer_thread.join()
+
+class RingBuffer:
+    """Fixed-capacity history of (timestamp, value) samples kept in parallel float64 arrays.
+    Once full, each new sample overwrites the oldest one."""
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.timestamps = array('d', [0.0]) * capacity
+        self.values = array('d', [0.0]) * capacity
+        self.count = 0  # Samples ever appended
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, timestamp, value):
+        slot = self.count % self.capacity
+        self.timestamps[slot] = timestamp
+        self.values[slot] = value
+        self.count += 1
+
+    def latest(self):
+        """Most recent (timestamp, value), or None when empty"""
+        if not self.count:
+            return None
+        slot = (self.count - 1) % self.capacity
+        return self.timestamps[slot], self.values[slot]
+
+    def samples(self):
+        """Retained (timestamps, values), oldest first"""
+        if self.count <= self.capacity:
+            return self.timestamps[:self.count], self.values[:self.count]
+        slot = self.count % self.capacity
+        return (self.timestamps[slot:] + self.timestamps[:slot],
+                self.values[slot:] + self.values[:slot])
+
+    def summary(self):
+        """Min/mean/max/p95 over the retained samples"""
+        values = sorted(self.values[:len(self)])
+        if not values:
+            return None
+        return {
+            'samples': len(values),
+            'min': values[0],
+            'mean': math.fsum(values) / len(values),
+            'max': values[-1],
+            'p95': values[max(0, math.ceil(0.95 * len(values)) - 1)]  # Nearest rank
+        }
+
+    def copy(self):
+        copied = RingBuffer(self.capacity)
+        copied.timestamps = array('d', self.timestamps)
+        copied.values = array('d', self.values)
+        copied.count = self.count
+        return copied
+
+    def resized(self, capacity):
+        """Copy of this buffer with a new capacity, keeping the newest samples"""
+        resized = RingBuffer(capacity)
+        for timestamp, value in zip(*self.samples()):
+            resized.append(timestamp, value)
+        return resized
+
+# Where NetworkStats keeps its samples: 'sqlite' (typed, indexed, see stats_store) or 'csv'
+STATS_BACKEND = 'sqlite'
+
 class NetworkStats:
-    def __init__(self, csv_output_dir='network_stats'):
-        self.stats = defaultdict(lambda: {
-            'bytes_sent': 0,
-            'bytes_recv': 0,
-            'packets_sent': 0,
-            'packets_recv': 0,
-            'bandwidth_history': [],
-            'latency_history': []
-        })
+    def __init__(self, csv_output_dir='network_stats', buffered=True, history_capacity=3600,
+                 backend=STATS_BACKEND):
+        # Per-link counters; histories are RingBuffers so long runs use bounded memory
+        self.stats = {}
+        self.history_capacity = history_capacity
+        self.link_capacity = {}  # Per-link overrides of history_capacity
         self.lock = threading.Lock()
         self.csv_output_dir = csv_output_dir
         
         # Create output directory if it doesn't exist
         os.makedirs(csv_output_dir, exist_ok=True)
         
-        # Initialize CSV files with headers
-        self._init_csv_files()
+        self.store = None
+        self.csv_writer = None
+        if backend == 'sqlite':
+            # Samples go to the database; the CSVs are written from it by export_csv
+            self.store = StatsStore(os.path.join(csv_output_dir, DB_NAME))
+        else:
+            # Initialize CSV files with headers
+            self._init_csv_files()
+
+            # Rows go through a write-behind queue unless buffering is disabled
+            self.csv_writer = CSVWriteBehind() if buffered else None
     
     def _init_csv_files(self):
         """Initialize CSV files with headers"""
@@ -52,59 +192,443 @@ class NetworkStats:
         with open(f'{self.csv_output_dir}/latency.csv', 'w', newline='') as f:
             writer = csv.writer(f)
             writer.writerow(['timestamp', 'link', 'latency_ms'])
+        
+        # Switch queue CSV
+        with open(f'{self.csv_output_dir}/queue_stats.csv', 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['timestamp', 'link', 'queue_id', 'tx_bytes', 'tx_packets', 'drops',
+                             'throughput_mbps', 'violation'])
+
+    def _link(self, key):
+        """Stats entry for a link, created on first use (call with self.lock held)"""
+        if key not in self.stats:
+            capacity = self.link_capacity.get(key, self.history_capacity)
+            self.stats[key] = {
+                'bytes_sent': 0,
+                'bytes_recv': 0,
+                'packets_sent': 0,
+                'packets_recv': 0,
+                'bandwidth_history': RingBuffer(capacity),
+                'latency_history': RingBuffer(capacity),
+                # Per probe protocol: every RTT of the run, and [probes sent, probes lost]
+                'latency_histograms': {},
+                'probe_counts': {},
+                # Per switch queue on this link: throughput history, drops and violation counts
+                'queues': {}
+            }
+        return self.stats[key]
+
+    def set_history_capacity(self, node1, node2, capacity):
+        """Change how many bandwidth/latency/queue samples are kept for one link"""
+        key = f"{node1}-{node2}"
+        with self.lock:
+            self.link_capacity[key] = capacity
+            if key in self.stats:
+                for history in ('bandwidth_history', 'latency_history'):
+                    self.stats[key][history] = self.stats[key][history].resized(capacity)
+                for entry in self.stats[key]['queues'].values():
+                    entry['throughput_history'] = entry['throughput_history'].resized(capacity)
+
+    def get_stats(self):
+        """Consistent snapshot of all links for reporting"""
+        with self.lock:
+            return {key: dict(data,
+                              bandwidth_history=data['bandwidth_history'].copy(),
+                              latency_history=data['latency_history'].copy(),
+                              latency_histograms={protocol: histogram.copy() for protocol, histogram
+                                                  in data['latency_histograms'].items()},
+                              probe_counts={protocol: list(counts) for protocol, counts
+                                            in data['probe_counts'].items()},
+                              queues={queue_id: dict(entry, throughput_history=entry['throughput_history'].copy(),
+                                                  violations=dict(entry['violations']))
+                                      for queue_id, entry in data['queues'].items()})
+                    for key, data in self.stats.items()}
+
+    def _write_row(self, table, filename, ts_ns, key, values):
+        """Store one sample in the database, or append it as a row to one of the CSV files"""
+        if self.store:
+            self.store.add(table, ts_ns, key, values)
+            return
+        row = [datetime.fromtimestamp(ts_ns / 10**9).isoformat(), key] + list(values)
+        path = f'{self.csv_output_dir}/{filename}'
+        if self.csv_writer:
+            self.csv_writer.write(path, row)
+            return
+        with open(path, 'a', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(row)
+
+    def close(self):
+        """Flush buffered rows to disk"""
+        if self.csv_writer:
+            self.csv_writer.close()
+            self.csv_writer = None
+        if self.store:
+            self.store.close()
+
+    def query(self, table, start=None, end=None, links=None):
+        """Stored samples of 'traffic', 'bandwidth', 'latency' or 'queue' as (ts_ns, link, values...)
+        rows, for epoch-ns start/end and a list of link keys (sqlite backend only)"""
+        if not self.store:
+            raise RuntimeError("NetworkStats.query requires the sqlite backend; "
+                               f"the csv backend writes the samples to {self.csv_output_dir} directly")
+        self.store.flush()
+        return self.store.query(table, start, end, links)
+
+    def export_csv(self, output_dir=None):
+        """Write the stored samples as the traffic_stats/bandwidth/latency CSV files (sqlite
+        backend only; the csv backend already writes them)"""
+        if not self.store:
+            raise RuntimeError("NetworkStats.export_csv requires the sqlite backend; "
+                               f"the csv backend writes the samples to {self.csv_output_dir} directly")
+        self.store.flush()
+        self.store.export_csv(output_dir or self.csv_output_dir)
 
     def update_stats(self, node1, node2, bytes_sent, bytes_recv, packets_sent, packets_recv):
         with self.lock:
             key = f"{node1}-{node2}"
-            timestamp = datetime.now().isoformat()
+            ts_ns = time.time_ns()
             
-            if bytes_sent >= 0 and bytes_recv >= 0 and packets_sent >= 0 and packets_recv >= 0:
-                self.stats[key]['bytes_sent'] += bytes_sent
-                self.stats[key]['bytes_recv'] += bytes_recv
-                self.stats[key]['packets_sent'] += packets_sent
-                self.stats[key]['packets_recv'] += packets_recv
+            if not (bytes_sent >= 0 and bytes_recv >= 0 and packets_sent >= 0 and packets_recv >= 0):
+                return
+            link = self._link(key)
+            link['bytes_sent'] += bytes_sent
+            link['bytes_recv'] += bytes_recv
+            link['packets_sent'] += packets_sent
+            link['packets_recv'] += packets_recv
                 
-                # Write to CSV
-                with open(f'{self.csv_output_dir}/traffic_stats.csv', 'a', newline='') as f:
-                    writer = csv.writer(f)
-                    writer.writerow([timestamp, key, bytes_sent, bytes_recv, 
-                                   packets_sent, packets_recv])
+        # Store outside the lock
+        self._write_row('traffic', 'traffic_stats.csv', ts_ns, key,
+                        (bytes_sent, bytes_recv, packets_sent, packets_recv))
 
     def add_bandwidth_measurement(self, node1, node2, bandwidth):
         with self.lock:
             key = f"{node1}-{node2}"
-            timestamp = datetime.now().isoformat()
+            ts_ns = time.time_ns()
             
-            self.stats[key]['bandwidth_history'].append({
-                'timestamp': time.time(),
-                'bandwidth': bandwidth
-            })
+            self._link(key)['bandwidth_history'].append(ts_ns / 10**9, bandwidth)
             
-            # Write to CSV
-            with open(f'{self.csv_output_dir}/bandwidth.csv', 'a', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow([timestamp, key, bandwidth])
+        # Store outside the lock
+        self._write_row('bandwidth', 'bandwidth.csv', ts_ns, key, (bandwidth,))
 
     def add_latency_measurement(self, node1, node2, latency):
         with self.lock:
             key = f"{node1}-{node2}"
-            timestamp = datetime.now().isoformat()
+            ts_ns = time.time_ns()
             
-            self.stats[key]['latency_history'].append({
-                'timestamp': time.time(),
-                'latency': latency
-            })
+            self._link(key)['latency_history'].append(ts_ns / 10**9, latency)
             
-            # Write to CSV
-            with open(f'{self.csv_output_dir}/latency.csv', 'a', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow([timestamp, key, latency])
+        # Store outside the lock
+        self._write_row('latency', 'latency.csv', ts_ns, key, (latency,))
+
+    def add_latency_histogram(self, node1, node2, protocol, histogram, sent, lost):
+        """Merge one latency prober report (RTTs in microseconds) into the link's
+        histogram for that protocol"""
+        with self.lock:
+            link = self._link(f"{node1}-{node2}")
+            link['latency_histograms'].setdefault(protocol, LatencyHistogram()).merge(histogram)
+            counts = link['probe_counts'].setdefault(protocol, [0, 0])
+            counts[0] += sent
+            counts[1] += lost
+
+    def add_queue_measurement(self, switch, peer, queue_id, tx_bytes, tx_packets, drops, throughput, violation=''):
+        """One interval of a switch queue towards peer: bytes, packets and drops in the
+        interval, throughput in Mbps, and the configured rate it broke ('' if none)"""
+        with self.lock:
+            key = f"{switch}-{peer}"
+            ts_ns = time.time_ns()
+            
+            link = self._link(key)
+            entry = link['queues'].get(queue_id)
+            if entry is None:
+                capacity = self.link_capacity.get(key, self.history_capacity)
+                entry = link['queues'][queue_id] = {'throughput_history': RingBuffer(capacity), 'drops': 0,
+                                                 'violations': {'min-rate': 0, 'max-rate': 0}}
+            entry['throughput_history'].append(ts_ns / 10**9, throughput)
+            entry['drops'] += drops
+            if violation:
+                entry['violations'][violation] += 1
+            
+        # Store outside the lock
+        self._write_row('queue', 'queue_stats.csv', ts_ns, key,
+                        (queue_id, tx_bytes, tx_packets, drops, throughput, violation))
+
+def benchmark_network_stats(samples=50000, threads=6):
+    """Compare NetworkStats samples/sec with per-row file writes, the CSV write-behind
+    queue and the SQLite store, then time a one-link query against a CSV scan"""
+    print(f"Benchmarking NetworkStats with {samples} samples from {threads} threads")
+    for label, backend, buffered in (('per-row open/close', 'csv', False),
+                                     ('write-behind', 'csv', True),
+                                     ('sqlite', 'sqlite', True)):
+        output_dir = tempfile.mkdtemp(prefix='network_stats_bench_')
+        stats = NetworkStats(csv_output_dir=output_dir, buffered=buffered, backend=backend)
+
+        def record(thread_id):
+            for i in range(samples // threads):
+                link = (f'h{thread_id}', f's{i % 4}')
+                stats.update_stats(*link, 1500, 1500, 1, 1)
+                stats.add_bandwidth_measurement(*link, 9.5)
+                stats.add_latency_measurement(*link, 10.2)
+
+        workers = [threading.Thread(target=record, args=(t,)) for t in range(threads)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        recorded = time.perf_counter() - start
+        stats.close()
+        total = time.perf_counter() - start
+
+        rows = (samples // threads) * threads * 3
+        print(f"{label:>20}: {rows / recorded:>12,.0f} samples/sec recorded, "
+              f"{rows / total:>12,.0f} samples/sec including final flush")
+
+        # Every bandwidth sample of one link
+        start = time.perf_counter()
+        if backend == 'sqlite':
+            selected = stats.query('bandwidth', links=['h0-s1'])
+        else:
+            with open(f'{output_dir}/bandwidth.csv', newline='') as f:
+                selected = [row for row in csv.reader(f) if row[1] == 'h0-s1']
+        print(f"{'':>20}  one-link query: {len(selected)} samples in "
+              f"{(time.perf_counter() - start) * 1000:.1f} ms")
+        shutil.rmtree(output_dir, ignore_errors=True)
                 
+# Capture profiles, selected with --capture-profile:
+#   full     whole packets in one file, never rotated or overwritten (the default)
+#   headers  the first 128 bytes of each packet, rotated every 100 MB (-C) into a ring of
+#            20 segments (-W) that overwrites the oldest one, so only the last 2 GB are kept
+#   timed    the first 128 bytes of each packet, a new segment every 60 s (-G); -W is not
+#            used because with -G alone it makes tcpdump exit after that many files
+#   counters no tcpdump and no pcaps: per-protocol tc counters sampled every interval seconds
+# The bandwidth analysis uses each packet's wire length, so headers are enough for it.
+# snaplen 0 keeps the whole packet; aggregate selects the tc counters instead of tcpdump.
+CAPTURE_PROFILES = {
+    'full': {'snaplen': 0, 'rotate_mb': None, 'rotate_seconds': None, 'max_files': None, 'aggregate': False},
+    'headers': {'snaplen': 128, 'rotate_mb': 100, 'rotate_seconds': None, 'max_files': 20, 'aggregate': False},
+    'timed': {'snaplen': 128, 'rotate_mb': None, 'rotate_seconds': 60, 'max_files': None, 'aggregate': False},
+    'counters': {'snaplen': None, 'rotate_mb': None, 'rotate_seconds': None, 'max_files': None,
+                 'aggregate': True, 'interval': 1.0},
+}
+DEFAULT_CAPTURE_PROFILE = 'full'
+
+# Lines of tcpdump's exit summary, by status key
+CAPTURE_STAT_LINES = {
+    'captured': 'packets captured',
+    'received': 'packets received by filter',
+    'dropped': 'packets dropped by kernel',
+}
+CAPTURE_STOP_TIMEOUT = 5.0   # seconds a capture gets to flush after SIGINT before it is killed
+CAPTURE_STOP_WORKERS = 64
+
+# tc classifiers of the aggregation-only mode, in match order. A packet is counted only by
+# the first filter it matches, so the columns split traffic like classify_frame does
+# (ICMPv6 is echo and neighbor discovery only; everything else ends up in Other).
+COUNTER_FILTERS = [
+    ('TCP', 'protocol ip flower ip_proto tcp'),
+    ('TCP', 'protocol ipv6 flower ip_proto tcp'),
+    ('UDP', 'protocol ip flower ip_proto udp'),
+    ('UDP', 'protocol ipv6 flower ip_proto udp'),
+    ('ICMP', 'protocol ip flower ip_proto icmp'),
+    ('ICMPv6', 'protocol ipv6 flower ip_proto icmpv6 type 128'),
+    ('ICMPv6', 'protocol ipv6 flower ip_proto icmpv6 type 129'),
+    ('ICMPv6', 'protocol ipv6 flower ip_proto icmpv6 type 135'),
+    ('ICMPv6', 'protocol ipv6 flower ip_proto icmpv6 type 136'),
+    ('ARP', 'protocol arp matchall'),
+    ('Other', 'protocol all matchall'),
+]
+COUNTER_CSV_HEADER = ['Timestamp', 'Timestamp_ms'] + [f'{protocol}_bps' for protocol in PROTOCOLS]
+ETH_HEADER_LEN = 14          # tc ingress counts bytes after the Ethernet header was pulled
+COUNTER_READ_TIMEOUT = 5.0
+COUNTER_READ_WORKERS = 32
+
+class InterfaceCounterCollector:
+    """Per-protocol bandwidth of host interfaces from tc counters instead of pcaps.
+    Each interface gets a clsact qdisc with the COUNTER_FILTERS on ingress and egress.
+    Every interval the filters' byte counters are read and the deltas are written in the
+    bandwidth_usage.csv schema, one file per interface. Nothing is written per packet,
+    so this suits long runs where a full capture costs too much."""
+    def __init__(self, net, output_dir='tcpdump_data', interval=1.0, live_monitor=None):
+        self.net = net
+        self.output_dir = output_dir
+        self.interval = interval
+        # Optional LiveBandwidthMonitor that gets every sample, for livestats
+        self.live_monitor = live_monitor
+        self.interfaces = {}  # (node, intf) -> node, csv file and writer, last counters and time
+        self.lock = threading.Lock()
+        self.running = False
+        self.thread = None
+        os.makedirs(output_dir, exist_ok=True)
+
+    def attach(self, interfaces):
+        """Install the counting filters on (node, interface) pairs, on all nodes at once,
+        and start sampling them"""
+        interfaces = list(interfaces)
+        paths = []
+        try:
+            for node, intf in interfaces:
+                lines = [f'qdisc add dev {intf} clsact']
+                for direction in ('ingress', 'egress'):
+                    for pref, (_, spec) in enumerate(COUNTER_FILTERS, 1):
+                        lines.append(f'filter add dev {intf} {direction} pref {pref} {spec} action pass')
+                fd, path = tempfile.mkstemp(prefix=f'{node.name}-{intf}-', suffix='.tc')
+                paths.append(path)
+                with os.fdopen(fd, 'w') as f:
+                    f.write('\n'.join(lines) + '\n')
+            # Drop the filters of an earlier run first; clsact lives beside TCLink's root qdisc
+            outputs = run_commands((node, f'tc qdisc del dev {intf} clsact 2> /dev/null; tc -force -batch {path}')
+                                   for (node, intf), path in zip(interfaces, paths))
+        finally:
+            for path in paths:
+                os.remove(path)
+
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        for (node, intf), output in zip(interfaces, outputs):
+            if isinstance(output, Exception) or output.strip():
+                print(f"tc -batch on {node.name} {intf}: {str(output).strip()}")
+                if isinstance(output, Exception):
+                    continue
+            filename = f'{self.output_dir}/{node.name}_{intf}_{timestamp}_bandwidth.csv'
+            csvfile = open(filename, 'w', newline='')
+            writer = csv.writer(csvfile)
+            writer.writerow(COUNTER_CSV_HEADER)
+            # The filters were just created, so every counter starts from zero
+            entry = {'node': node, 'filename': filename, 'file': csvfile, 'writer': writer,
+                     'bytes': [0] * len(PROTOCOLS), 'time': time.time(), 'rows': 0}
+            with self.lock:
+                self.interfaces[(node.name, intf)] = entry
+            print(f"Counting per-protocol bytes on {node.name} interface {intf}, saving to {filename}")
+        if self.interfaces and not self.running:
+            self.start()
+
+    @staticmethod
+    def parse_filter_stats(output, header_len=0):
+        """Bytes per PROTOCOLS column from `tc -s -j filter show` output"""
+        totals = [0] * len(PROTOCOLS)
+        for entry in json.loads(output or '[]'):
+            pref = entry.get('pref')
+            actions = entry.get('options', {}).get('actions')
+            # Each filter is listed once bare and once with its handle, options and actions
+            if not actions or not pref or pref > len(COUNTER_FILTERS):
+                continue
+            stats = actions[0].get('stats', {})
+            column = PROTOCOLS.index(COUNTER_FILTERS[pref - 1][0])
+            totals[column] += stats.get('bytes', 0) + header_len * stats.get('packets', 0)
+        return totals
+
+    def read_counters(self, node, intf):
+        """Bytes per PROTOCOLS column seen on an interface in both directions, with the
+        Ethernet header counted as in a capture's wire length"""
+        totals = [0] * len(PROTOCOLS)
+        for direction, header_len in (('ingress', ETH_HEADER_LEN), ('egress', 0)):
+            # popen rather than node.cmd: the monitor threads use the hosts' shells meanwhile
+            process = node.popen(['tc', '-s', '-j', 'filter', 'show', 'dev', intf, direction],
+                                 stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            try:
+                output, _ = process.communicate(timeout=COUNTER_READ_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.communicate()
+                raise
+            if isinstance(output, bytes):
+                output = output.decode()
+            for column, count in enumerate(self.parse_filter_stats(output, header_len)):
+                totals[column] += count
+        return totals
+
+    def record(self, entry, counters, now):
+        """Write the bits per second since the entry's previous sample"""
+        elapsed = now - entry['time']
+        if elapsed <= 0:
+            return
+        # A counter below its last value means the filters were re-created; count from zero
+        deltas = [current - last if current >= last else current
+                  for current, last in zip(counters, entry['bytes'])]
+        start = entry['time']
+        entry['writer'].writerow([datetime.fromtimestamp(start).strftime('%Y-%m-%d %H:%M:%S'),
+                                  int(start * 1000)] + [8 * delta / elapsed for delta in deltas])
+        entry['file'].flush()
+        entry['bytes'], entry['time'] = counters, now
+        entry['rows'] += 1
+        if self.live_monitor:
+            self.live_monitor.add_counts(int(start * 10**9), [8 * delta for delta in deltas])
+
+    def sample(self, pool):
+        """Read every interface's counters concurrently and record one row each"""
+        with self.lock:
+            keys = list(self.interfaces)
+            nodes = [self.interfaces[key]['node'] for key in keys]
+
+        def read(item):
+            (node_name, intf), node = item
+            try:
+                return self.read_counters(node, intf), time.time()
+            except Exception as e:
+                print(f"Error reading counters on {node_name} interface {intf}: {e}")
+                return None, None
+
+        results = list(pool.map(read, zip(keys, nodes)))
+        with self.lock:
+            for key, (counters, now) in zip(keys, results):
+                # Skip interfaces detached while their counters were being read
+                if counters is not None and key in self.interfaces:
+                    self.record(self.interfaces[key], counters, now)
+
+    def run(self):
+        next_sample = time.time() + self.interval
+        with ThreadPoolExecutor(max_workers=COUNTER_READ_WORKERS) as pool:
+            while self.running:
+                time.sleep(max(0, next_sample - time.time()))
+                next_sample += self.interval
+                if self.running:
+                    self.sample(pool)
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def detach(self, node_name=None, interface=None):
+        """Record a final sample, remove the filters and close the files of the matching
+        interfaces (all of them by default)"""
+        with self.lock:
+            keys = [(n, i) for n, i in self.interfaces
+                    if (node_name is None or n == node_name) and (interface is None or i == interface)]
+            detached = [(key, self.interfaces.pop(key)) for key in keys]
+            last = not self.interfaces
+        if last and self.running:
+            self.running = False
+            self.thread.join()
+
+        for (name, intf), entry in detached:
+            try:
+                self.record(entry, self.read_counters(entry['node'], intf), time.time())
+            except Exception as e:
+                print(f"Error reading final counters on {name} interface {intf}: {e}")
+        outputs = run_commands((entry['node'], f'tc qdisc del dev {intf} clsact')
+                               for (_, intf), entry in detached)
+        for ((name, intf), entry), output in zip(detached, outputs):
+            if isinstance(output, Exception):
+                print(f"Error removing counters from {name} interface {intf}: {output}")
+            entry['file'].close()
+            print(f"Stopped counting on {name} interface {intf}: {entry['rows']} interval(s) saved to {entry['filename']}")
+
 class TCPDumpCollector:
-    def __init__(self, net, output_dir='tcpdump_data'):
+    def __init__(self, net, output_dir='tcpdump_data', live_monitor=None, profile=DEFAULT_CAPTURE_PROFILE):
         self.net = net
         self.output_dir = output_dir
         self.processes = {}
+        # (node, interface) -> packets captured / received / dropped, once the capture stopped
+        self.status = {}
+        self.profile = CAPTURE_PROFILES[profile] if isinstance(profile, str) else profile
+        # Optional LiveBandwidthMonitor that tails every capture file while it is written
+        self.live_monitor = live_monitor
+        # Aggregation-only profiles count bytes per protocol in tc instead of writing pcaps
+        self.counters = None
+        if self.profile['aggregate']:
+            self.counters = InterfaceCounterCollector(net, output_dir, self.profile['interval'], live_monitor)
         os.makedirs(output_dir, exist_ok=True)
     
     def start_capture(self, node, interface=None, filter_str=None):
@@ -118,39 +642,98 @@ class TCPDumpCollector:
         else:
             interfaces = [interface]
         
+        if self.counters:
+            try:
+                self.counters.attach((node, intf) for intf in interfaces)
+            except Exception as e:
+                print(f"Error starting counters on {node.name}: {e}")
+            return
+        
         for intf in interfaces:
             try:
-                # Create filename based on node, interface and timestamp
+                # Create filename based on node, interface and timestamp; every segment of a
+                # rotated capture starts with this base name
                 timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                filename = f'{self.output_dir}/{node.name}_{intf}_{timestamp}.pcap'
+                base = f'{self.output_dir}/{node.name}_{intf}_{timestamp}'
+                filename = f'{base}_%H%M%S.pcap' if self.profile['rotate_seconds'] else f'{base}.pcap'
                 
-                # Build tcpdump command using pgrep to get PID reliably
-                cmd = f'tcpdump -i {intf} -w {filename}'
+                # Build the tcpdump argument list; it is started without a shell, so the
+                # handle's PID is tcpdump itself and no pgrep is needed to find it
+                args = ['tcpdump', '-i', intf, '-s', str(self.profile['snaplen']), '-w', filename]
+                if self.profile['rotate_mb']:
+                    args += ['-C', str(self.profile['rotate_mb'])]
+                    if self.profile['max_files']:
+                        args += ['-W', str(self.profile['max_files'])]
+                if self.profile['rotate_seconds']:
+                    args += ['-G', str(self.profile['rotate_seconds'])]
+                rotating = self.profile['rotate_mb'] or self.profile['rotate_seconds']
+                if rotating:
+                    # Keep root so tcpdump can still create segments after dropping privileges
+                    args += ['-Z', 'root']
+                if self.live_monitor:
+                    # Packet-buffered output so the live monitor sees packets as they arrive
+                    args.append('-U')
                 if filter_str:
-                    cmd += f' "{filter_str}"'
-                
-                # Start tcpdump in background
-                node.cmd(f'{cmd} > /dev/null 2>&1 &')
-                
-                # Get PID using pgrep
-                pid_output = node.cmd(f"pgrep -f 'tcpdump -i {intf}'")
+                    args.append(filter_str)
                 
-                # Extract PID from output
-                try:
-                    pid = int(pid_output.strip().split('\n')[0])
-                except (ValueError, IndexError) as e:
-                    print(f"Warning: Could not get PID for tcpdump on {node.name} {intf}, using placeholder")
-                    pid = -1
+                # tcpdump prints its capture statistics to stderr when it exits
+                handle = node.popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
                 
                 self.processes[(node.name, intf)] = {
-                    'pid': pid,
-                    'file': filename
+                    'handle': handle,
+                    'pid': handle.pid,
+                    'file': filename,
+                    'segments': f'{base}*.pcap*'
                 }
-                print(f"Started tcpdump on {node.name} interface {intf}, saving to {filename} (PID: {pid})")
+                print(f"Started tcpdump on {node.name} interface {intf}, saving to {filename} (PID: {handle.pid})")
+
+                if self.live_monitor and rotating:
+                    self.live_monitor.add_segments(f'{node.name}-{intf}', f'{base}*.pcap*')
+                elif self.live_monitor:
+                    self.live_monitor.add_file(f'{node.name}-{intf}', filename)
                 
             except Exception as e:
                 print(f"Error starting tcpdump on {node.name} interface {intf}: {e}")
     
+    def start_captures(self, nodes):
+        """Start capturing on every interface of the given nodes; in aggregation-only mode
+        the counters of all nodes are set up at once"""
+        if self.counters:
+            try:
+                self.counters.attach((node, intf.name) for node in nodes
+                                     for intf in node.intfs.values() if intf.name != 'lo')
+            except Exception as e:
+                print(f"Error starting counters: {e}")
+            return
+        for node in nodes:
+            self.start_capture(node)
+
+    @staticmethod
+    def parse_capture_stats(stderr):
+        """Read tcpdump's exit summary: packets captured / received by filter / dropped by kernel"""
+        stats = {}
+        for line in stderr.splitlines():
+            for key, label in CAPTURE_STAT_LINES.items():
+                if line.endswith(label):
+                    try:
+                        stats[key] = int(line.split()[0])
+                    except (ValueError, IndexError):
+                        pass
+        return stats
+
+    def finish(self, process):
+        """Wait for a capture that was sent SIGINT; kill it if it does not flush in time"""
+        handle = process['handle']
+        try:
+            _, stderr = handle.communicate(timeout=CAPTURE_STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            handle.kill()
+            _, stderr = handle.communicate()
+            process['killed'] = True
+        if isinstance(stderr, bytes):
+            stderr = stderr.decode(errors='replace')
+        return self.parse_capture_stats(stderr or '')
+
     def stop_capture(self, node=None, interface=None):
         """Stop tcpdump capture"""
         if node:
@@ -159,41 +742,66 @@ class TCPDumpCollector:
             else:
                 node_name = node.name
             
+            if self.counters:
+                self.counters.detach(node_name, interface)
             # Stop specific interface or all interfaces for the node
             to_stop = [(n, i) for n, i in self.processes.keys() 
                       if n == node_name and (interface is None or i == interface)]
         else:
             # Stop all captures
+            if self.counters:
+                self.counters.detach()
             to_stop = list(self.processes.keys())
+        if not to_stop:
+            return
         
-        for node_name, intf in to_stop:
+        # SIGINT makes tcpdump flush its buffer and print its statistics. Signal every
+        # capture first, then wait for them together so they all flush at the same time.
+        stopping = {}
+        for key in to_stop:
+            process = self.processes.pop(key)
             try:
-                process = self.processes.pop((node_name, intf))
-                node = self.net.get(node_name)
-                
-                # Kill tcpdump process more reliably
-                if process['pid'] != -1:
-                    node.cmd(f'kill {process["pid"]}')
-                
-                # Backup method to ensure tcpdump is stopped
-                node.cmd(f"pkill -f 'tcpdump -i {intf}'")
-                
-                print(f"Stopped tcpdump on {node_name} interface {intf}")
-                print(f"Capture saved to {process['file']}")
-                
-            except Exception as e:
-                print(f"Error stopping tcpdump on {node_name} interface {intf}: {e}")
+                process['handle'].send_signal(signal.SIGINT)
+            except OSError as e:
+                print(f"Error stopping tcpdump on {key[0]} interface {key[1]}: {e}")
+            stopping[key] = process
+        
+        workers = min(len(stopping), CAPTURE_STOP_WORKERS)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = dict(zip(stopping, pool.map(self.finish, stopping.values())))
+        
+        for (node_name, intf), stats in results.items():
+            process = stopping[(node_name, intf)]
+            self.status[(node_name, intf)] = stats
+            how = 'killed after timeout' if process.get('killed') else 'stopped'
+            summary = ', '.join(f"{stats[key]} {label}" for key, label in CAPTURE_STAT_LINES.items()
+                                if key in stats)
+            print(f"tcpdump on {node_name} interface {intf} {how}: {summary or 'no statistics'}")
+            if stats.get('dropped'):
+                print(f"  Warning: the kernel dropped {stats['dropped']} packets on {node_name} {intf}")
+            self.report_segments(node_name, intf, process['segments'], stats.get('captured'))
     
+    def report_segments(self, node_name, intf, pattern, captured=None):
+        """Print a capture's segments and its disk bytes per captured packet. The packet
+        count comes from tcpdump's exit summary, so no segment is read back."""
+        segments = sorted(glob.glob(pattern))
+        disk_bytes = sum(os.path.getsize(segment) for segment in segments)
+        print(f"Capture saved to {len(segments)} segment(s) matching {pattern}: {disk_bytes} bytes")
+        if not captured:
+            return
+        max_files = self.profile['max_files']
+        if max_files and len(segments) >= max_files:
+            # The ring may have overwritten older segments, whose packets tcpdump still counted
+            print(f"  {node_name} {intf}: {captured} packets captured, ring of {max_files} segments "
+                  f"is full, so disk bytes/packet is not known")
+            return
+        print(f"  {node_name} {intf}: {captured} packets, {disk_bytes / captured:.1f} disk bytes/packet")
+
     def cleanup(self):
         """Cleanup all tcpdump processes"""
         try:
-            # Stop all captures
+            # Every capture has its own handle, so stopping them all leaves none behind
             self.stop_capture()
-            
-            # Additional cleanup to ensure no tcpdump processes remain
-            for node in self.net.hosts:
-                node.cmd('pkill -f tcpdump')
-            
             print("Cleaned up all tcpdump processes")
             
         except Exception as e:
@@ -231,10 +839,314 @@ class ExpandedQoSTopoOF13(Topo):
         self.addLink(s3, s4, cls=TCLink, bw=20, delay='2ms', loss=0)
         self.addLink(s1, s4, cls=TCLink, bw=20, delay='2ms', loss=0)
 
+IPERF_BASE_PORT = 5001      # Host i's pooled iperf server listens on IPERF_BASE_PORT + i
+IPERF_START_TIMEOUT = 2.0   # Seconds to wait for a new server to start listening
+
+class IperfServerPool:
+    """One long-lived iperf server per host, each on its own port.
+    Servers are started once and reused by every measurement. A server that has died
+    or stopped listening is restarted the next time its host is measured. Servers run
+    through host.popen, outside the host shells, so probe threads never share a shell
+    with the CLI or with run_commands."""
+    def __init__(self, base_port=IPERF_BASE_PORT):
+        self.base_port = base_port
+        self.ports = {}      # host name -> port
+        self.servers = {}    # host name -> server Popen
+        self.host_locks = defaultdict(threading.Lock)
+        self.lock = threading.Lock()
+
+    def port_for(self, host):
+        with self.lock:
+            return self.ports.setdefault(host.name, self.base_port + len(self.ports))
+
+    @staticmethod
+    def listening(pid, port):
+        """True if the process's namespace has a TCP socket listening on port"""
+        for table in ('tcp', 'tcp6'):
+            try:
+                with open(f'/proc/{pid}/net/{table}') as f:
+                    next(f)
+                    for line in f:
+                        fields = line.split()
+                        # local_address is hexip:hexport, state 0A is LISTEN
+                        if fields[3] == '0A' and int(fields[1].rsplit(':', 1)[1], 16) == port:
+                            return True
+            except (OSError, StopIteration):
+                pass
+        return False
+
+    def healthy(self, host):
+        server = self.servers.get(host.name)
+        if server is None or server.poll() is not None:
+            return False
+        return self.listening(server.pid, self.port_for(host))
+
+    def launch(self, host):
+        """Start a server in the host's namespace and keep its process"""
+        port = self.port_for(host)
+        try:
+            self.servers[host.name] = host.popen(['iperf', '-s', '-p', str(port)],
+                                                 stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except OSError as e:
+            print(f"Could not start iperf server on {host.name}: {e}")
+        return port
+
+    def wait_listening(self, hosts, timeout=IPERF_START_TIMEOUT):
+        """Wait until every host's server listens; returns the hosts that never did"""
+        pending = list(hosts)
+        deadline = time.monotonic() + timeout
+        while pending and time.monotonic() < deadline:
+            pending = [host for host in pending if not self.healthy(host)]
+            if pending:
+                time.sleep(0.02)
+        return pending
+
+    def start(self, hosts):
+        """Start servers on every host at once instead of one at a time"""
+        for host in hosts:
+            with self.host_locks[host.name]:
+                if not self.healthy(host):
+                    self.kill(host.name)
+                    self.launch(host)
+        for host in self.wait_listening(hosts):
+            print(f"iperf server on {host.name} did not start listening")
+
+    def ensure(self, host):
+        """Return the port of the host's server, (re)starting it if it is not healthy.
+        Returns None when the server cannot be started."""
+        with self.host_locks[host.name]:
+            if self.healthy(host):
+                return self.port_for(host)
+            if host.name in self.servers:
+                print(f"iperf server on {host.name} is not healthy, restarting it")
+                self.kill(host.name)
+            port = self.launch(host)
+            if self.wait_listening([host]):
+                print(f"iperf server on {host.name} did not start listening")
+                return None
+            return port
+
+    def kill(self, host_name):
+        server = self.servers.pop(host_name, None)
+        if server is not None:
+            server.terminate()
+            try:
+                server.wait(timeout=IPERF_START_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                server.kill()
+                server.wait()
+
+    def stop(self):
+        """Stop all pooled servers; call before net.stop()"""
+        for host_name in list(self.servers):
+            self.kill(host_name)
+
+# Active probe schedule used by NetworkMonitor; entries can be overridden per run
+PROBE_SCHEDULE = {
+    'interval': 5.0,              # seconds between the starts of consecutive sweeps
+    'latency_pairs': 'mesh',      # 'mesh' = every host pair, 'sampled' = even x odd hosts
+    'bandwidth_pairs': 'sampled',
+    'latency_mode': 'prober',     # 'prober' = latency_prober on every host, 'ping' = one ping per pair per sweep
+    'latency_rate': 20,           # prober probes per second per target and protocol
+    'latency_protocols': ['icmp', 'tcp', 'udp'],  # one per queue of FLOW_RULES
+    'latency_deadline': 2.0,      # seconds a single ping may take
+    'bandwidth_duration': 2,      # iperf -t
+    'bandwidth_deadline': 5.0,    # seconds a single iperf run may take, server start included
+    'max_workers': 16,            # probes in flight at once
+    'queue_interval': 1.0,        # seconds between switch queue-stats samples (0 = off)
+}
+
+class ProbeScheduler:
+    """Plans and runs one sweep of active probes.
+    Latency probes all run concurrently. Bandwidth probes are grouped into batches
+    whose paths share no link, each batch runs in parallel and batches run in turn."""
+    def __init__(self, net, schedule=None):
+        self.net = net
+        self.schedule = dict(PROBE_SCHEDULE, **(schedule or {}))
+        self.graph = self.build_link_graph()
+        self.path_cache = {}
+
+    def build_link_graph(self):
+        """Adjacency list of node name -> [(neighbor name, link)]"""
+        graph = defaultdict(list)
+        for link in self.net.links:
+            node1, node2 = link.intf1.node.name, link.intf2.node.name
+            graph[node1].append((node2, link))
+            graph[node2].append((node1, link))
+        return graph
+
+    def path_links(self, src, dst):
+        """Links on the shortest (BFS) path between two nodes. Flow rules may route
+        around a loop differently; this is only used to keep probes apart."""
+        key = (src.name, dst.name)
+        if key not in self.path_cache:
+            parent = {src.name: None}
+            frontier = deque([src.name])
+            while frontier:
+                node = frontier.popleft()
+                if node == dst.name:
+                    break
+                for neighbor, link in self.graph[node]:
+                    if neighbor not in parent:
+                        parent[neighbor] = (node, link)
+                        frontier.append(neighbor)
+            links = set()
+            node = dst.name
+            while parent.get(node):
+                node, link = parent[node]
+                links.add(link)
+            self.path_cache[key] = links
+        return self.path_cache[key]
+
+    def host_pairs(self, mode):
+        hosts = self.net.hosts
+        if mode == 'mesh':
+            return list(itertools.combinations(hosts, 2))
+        return [(h1, h2) for h1 in hosts[::2] for h2 in hosts[1::2] if h1 != h2]
+
+    def disjoint_batches(self, pairs):
+        """Greedy first-fit of pairs into batches with link-disjoint paths"""
+        batches = []
+        for pair in pairs:
+            links = self.path_links(*pair)
+            for used, batch in batches:
+                if not used & links:
+                    used |= links
+                    batch.append(pair)
+                    break
+            else:
+                batches.append((set(links), [pair]))
+        return [batch for _, batch in batches]
+
+    def run_sweep(self, monitor):
+        """Run every probe once and record the results through the monitor's collector"""
+        schedule = self.schedule
+        stats = monitor.stats_collector
+        with ThreadPoolExecutor(max_workers=schedule['max_workers']) as pool:
+            # Latency first, so pings are not queued behind iperf traffic. In prober mode
+            # the latency probers measure continuously and there is nothing to do here.
+            if schedule['latency_mode'] == 'ping':
+                pairs = self.host_pairs(schedule['latency_pairs'])
+                futures = [pool.submit(monitor.measure_latency, h1, h2, schedule['latency_deadline'])
+                           for h1, h2 in pairs]
+                for (h1, h2), future in zip(pairs, futures):
+                    stats.add_latency_measurement(h1.name, h2.name, future.result())
+
+            for batch in self.disjoint_batches(self.host_pairs(schedule['bandwidth_pairs'])):
+                futures = [pool.submit(monitor.measure_bandwidth, h1, h2,
+                                       schedule['bandwidth_duration'], schedule['bandwidth_deadline'])
+                           for h1, h2 in batch]
+                for (h1, h2), future in zip(batch, futures):
+                    stats.add_bandwidth_measurement(h1.name, h2.name, future.result())
+
+QUEUE_RATE_TOLERANCE = 0.1  # Fraction a queue may be off its min-rate/max-rate before it is flagged
+
+class QueueStatsCollector:
+    """Throughput and drops of the switches' QoS queues from `ovs-ofctl queue-stats`.
+    Every interval all switches are read in one pass and each queue's deltas are
+    recorded through NetworkStats.add_queue_measurement under the switch-peer link of
+    its port, so they share timestamps and link names with the other samples.
+    A sample is flagged 'max-rate' when the queue sent faster than its max-rate, and
+    'min-rate' when it dropped packets while sending slower than its min-rate: the
+    drops show it had backlog that the guarantee should have served."""
+    def __init__(self, net, stats_collector, queues, interval=1.0, tolerance=QUEUE_RATE_TOLERANCE):
+        self.net = net
+        self.stats_collector = stats_collector
+        # queue id -> (min-rate, max-rate) in bits/s, None where not configured
+        self.rates = {int(queue_id): tuple(float(config[key]) if key in config else None
+                                        for key in ('min-rate', 'max-rate'))
+                      for queue_id, config in queues.items()}
+        self.interval = interval
+        self.tolerance = tolerance
+        self.previous = {}  # (switch, port, queue) -> (tx bytes, tx packets, drops, seconds)
+        self.violating = set()  # (switch, port, queue) flagged in the latest sample
+        self.running = False
+        self.thread = None
+
+    @staticmethod
+    def port_peer(switch, port):
+        """Interface name and the name of the node on the other end of a switch port"""
+        intf = switch.intfs.get(port)
+        if intf is None:
+            return f'port{port}', f'port{port}'
+        link = intf.link
+        if not link:
+            return intf.name, intf.name
+        other = link.intf2 if link.intf1 is intf else link.intf1
+        return intf.name, other.node.name
+
+    def check_rates(self, queue_id, throughput, drops):
+        """'max-rate', 'min-rate' or '' for one interval of a queue (throughput in bits/s)"""
+        min_rate, max_rate = self.rates.get(queue_id, (None, None))
+        if max_rate is not None and throughput > max_rate * (1 + self.tolerance):
+            return 'max-rate'
+        if min_rate is not None and drops and throughput < min_rate * (1 - self.tolerance):
+            return 'min-rate'
+        return ''
+
+    def sample(self):
+        """Read every switch's queue counters and record one interval per queue"""
+        now = time.time()
+        switches = list(self.net.switches)
+        for switch, queues in zip(switches, read_queue_stats(switches)):
+            if isinstance(queues, Exception):
+                print(f"Error reading queue stats on {switch.name}: {queues}")
+                continue
+            for (port, queue_id), (tx_bytes, tx_packets, drops, duration) in sorted(queues.items(), key=str):
+                key = (switch.name, port, queue_id)
+                # The queue's own age is more precise than our clock when the switch reports it
+                seconds = duration if duration is not None else now
+                previous = self.previous.get(key)
+                self.previous[key] = (tx_bytes, tx_packets, drops, seconds)
+                if previous is None or seconds <= previous[3]:
+                    continue
+                # A counter below its last value means the queue was re-created; count from zero
+                deltas = [current - last if current >= last else current
+                          for current, last in zip((tx_bytes, tx_packets, drops), previous)]
+                throughput = 8 * deltas[0] / (seconds - previous[3])
+                violation = self.check_rates(queue_id, throughput, deltas[2])
+                intf, peer = self.port_peer(switch, port)
+                self.stats_collector.add_queue_measurement(switch.name, peer, queue_id, deltas[0], deltas[1],
+                                                           deltas[2], throughput / 1e6, violation)
+                # Report a queue when it starts breaking its rates, not on every interval
+                if violation and key not in self.violating:
+                    min_rate, max_rate = self.rates[queue_id]
+                    limit = max_rate if violation == 'max-rate' else min_rate
+                    print(f"Queue {queue_id} on {intf} (to {peer}) breaks its {violation}: "
+                          f"{throughput / 1e6:.2f} Mbps against {limit / 1e6:.2f} Mbps, {deltas[2]} drops")
+                    self.violating.add(key)
+                elif not violation:
+                    self.violating.discard(key)
+
+    def run(self):
+        next_sample = time.time()
+        while self.running:
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"Error sampling queue stats: {e}")
+            next_sample = max(next_sample + self.interval, time.time())
+            time.sleep(max(0, next_sample - time.time()))
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+
 class NetworkMonitor:
-    def __init__(self, net, stats_collector):
+    def __init__(self, net, stats_collector, schedule=None, iperf_pool=None):
         self.net = net
         self.stats_collector = stats_collector
+        self.schedule = schedule
+        self.iperf_pool = iperf_pool or IperfServerPool()
+        self.latency_probers = None
+        self.queue_collector = None
         self.running = False
         self.monitor_thread = None
         self.prev_stats = {}
@@ -243,6 +1155,17 @@ class NetworkMonitor:
         """Get interface statistics using ip tool instead of ifconfig"""
         # Use ip -s link show instead of ifconfig for more reliable stats
         output = node.cmd(f'ip -s link show {interface}')
+        return self.parse_ip_link_stats(interface, output)
+
+    def get_all_interface_stats(self, interfaces):
+        """ip -s link statistics of many (node, interface) pairs, all nodes queried at once"""
+        outputs = run_commands((node, f'ip -s link show {interface}') for node, interface in interfaces)
+        return [self.parse_ip_link_stats(interface, output) if not isinstance(output, Exception) else (0, 0, 0, 0)
+                for (_, interface), output in zip(interfaces, outputs)]
+
+    @staticmethod
+    def parse_ip_link_stats(interface, output):
+        """(rx_bytes, tx_bytes, rx_packets, tx_packets) from `ip -s link show` output"""
         rx_bytes = tx_bytes = rx_packets = tx_packets = 0
         
         try:
@@ -268,20 +1191,54 @@ class NetworkMonitor:
             
         return rx_bytes, tx_bytes, rx_packets, tx_packets
 
-    def measure_bandwidth(self, source, target, duration=2):
+    @staticmethod
+    def parse_proc_net_dev(text):
+        """Parse /proc/net/dev by interface name into {name: (rx_bytes, tx_bytes, rx_packets, tx_packets)}"""
+        counters = {}
+        for line in text.splitlines():
+            # Header lines have no colon; counters follow "name:" (with or without a space)
+            if ':' not in line:
+                continue
+            name, fields = line.split(':', 1)
+            fields = fields.split()
+            if len(fields) < 16:
+                continue
+            try:
+                counters[name.strip()] = (int(fields[0]), int(fields[8]), int(fields[1]), int(fields[9]))
+            except ValueError:
+                continue
+        return counters
+
+    def get_node_counters(self, node):
+        """Counters of every interface in a node's network namespace from a single read.
+        /proc/<pid>/net/dev shows the namespace of that process, so the node's shell pid
+        lets us read it directly instead of running a command through the node shell."""
+        try:
+            with open(f'/proc/{node.pid}/net/dev') as f:
+                text = f.read()
+        except (OSError, AttributeError):
+            text = node.cmd('cat /proc/net/dev')
+        return self.parse_proc_net_dev(text)
+
+    def measure_bandwidth(self, source, target, duration=2, deadline=None):
         """Measure bandwidth between two hosts using iperf"""
+        deadline = deadline or duration + 3
         try:
-            # Start iperf server with specific pid file
-            target.cmd('iperf -s -p 5001 > /dev/null 2>&1 & echo $! > /tmp/iperf_server.pid')
-            time.sleep(0.5)
+            # Reuse the target's pooled server; it is only (re)started if unhealthy
+            port = self.iperf_pool.ensure(target)
+            if port is None:
+                return 0
             
-            # Run iperf client
-            output = source.cmd(f'iperf -c {target.IP()} -t {duration} -p 5001')
-            
-            # Cleanup server
-            target.cmd('kill $(cat /tmp/iperf_server.pid)')
-            target.cmd('rm -f /tmp/iperf_server.pid')
-            target.cmd('pkill -9 iperf')
+            # Run iperf client outside the node shells so probes can run in parallel
+            client = source.popen(['iperf', '-c', target.IP(), '-t', str(duration), '-p', str(port)],
+                                  stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            try:
+                output = client.communicate(timeout=deadline)[0].decode(errors='replace')
+            except subprocess.TimeoutExpired:
+                client.kill()
+                client.wait()
+                print(f"Bandwidth probe {source.name} -> {target.name} missed its {deadline}s deadline")
+                return 0
             
             # Parse bandwidth
             if 'Mbits/sec' in output:
@@ -293,11 +1250,18 @@ class NetworkMonitor:
         
         return 0
 
-    def measure_latency(self, source, target):
+    def measure_latency(self, source, target, deadline=2.0):
         """Measure latency between two hosts using ping"""
         try:
-            source.waitOutput()
-            output = source.cmd(f'ping -c 1 -w 2 {target.IP()}')
+            proc = source.popen(['ping', '-c', '1', '-w', str(max(1, math.ceil(deadline))), target.IP()],
+                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            try:
+                output = proc.communicate(timeout=deadline + 0.5)[0].decode(errors='replace')
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+                print(f"Latency probe {source.name} -> {target.name} missed its {deadline}s deadline")
+                return 0
             if 'time=' in output:
                 latency = float(output.split('time=')[1].split()[0])
                 print(f"Measured latency between {source.name} and {target.name}: {latency} ms")
@@ -309,13 +1273,18 @@ class NetworkMonitor:
 
     def monitor_network(self):
         """Monitor network statistics"""
+        scheduler = ProbeScheduler(self.net, self.schedule)
+        next_sweep = time.monotonic()
         while self.running:
             try:
-                # Monitor interface statistics
+                # Monitor interface statistics, reading all of a host's counters at once
                 for host in self.net.hosts:
+                    counters = self.get_node_counters(host)
                     for intf in host.intfs.values():
                         if intf.name != 'lo' and intf.link:  # Ensure interface has a link
-                            current_stats = self.get_interface_stats(host, intf.name)
+                            current_stats = counters.get(intf.name)
+                            if current_stats is None:
+                                continue
                             
                             if intf.name in self.prev_stats:
                                 prev_vals = self.prev_stats[intf.name]
@@ -336,28 +1305,42 @@ class NetworkMonitor:
                             
                             self.prev_stats[intf.name] = current_stats
                 
-                # Measure bandwidth and latency between select hosts
-                for h1 in self.net.hosts[::2]:  # Sample subset of hosts
-                    for h2 in self.net.hosts[1::2]:
-                        if h1 != h2:
-                            h1.waitOutput()
-                            h2.waitOutput()
-                            
-                            bandwidth = self.measure_bandwidth(h1, h2)
-                            self.stats_collector.add_bandwidth_measurement(h1.name, h2.name, bandwidth)
-                            
-                            time.sleep(0.5)  # Short delay between measurements
-                            
-                            latency = self.measure_latency(h1, h2)
-                            self.stats_collector.add_latency_measurement(h1.name, h2.name, latency)
+                # Measure bandwidth and latency between host pairs
+                sweep_start = time.monotonic()
+                scheduler.run_sweep(self)
+                print(f"Probe sweep took {time.monotonic() - sweep_start:.2f}s")
                 
             except Exception as e:
                 print(f"Error in monitor_network: {e}")
             
-            time.sleep(5)  # Update interval
+            # Fixed cadence; a sweep that overruns starts the next one immediately
+            next_sweep = max(next_sweep + scheduler.schedule['interval'], time.monotonic())
+            time.sleep(max(0, next_sweep - time.monotonic()))
+
+    def record_latency_report(self, source, target, protocol, sent, lost, histogram):
+        """Latency prober callback: keep every RTT, plus the interval median of the first
+        protocol as the link's latency sample (what the per-sweep ping used to give)"""
+        self.stats_collector.add_latency_histogram(source, target, protocol, histogram, sent, lost)
+        schedule = dict(PROBE_SCHEDULE, **(self.schedule or {}))
+        median = histogram.percentile(50)
+        if protocol == schedule['latency_protocols'][0] and median is not None:
+            self.stats_collector.add_latency_measurement(source, target, median / 1000)
 
     def start_monitoring(self):
         """Start the monitoring thread"""
+        self.iperf_pool.start(self.net.hosts)
+        schedule = dict(PROBE_SCHEDULE, **(self.schedule or {}))
+        if schedule['latency_mode'] == 'prober':
+            pairs = ProbeScheduler(self.net, schedule).host_pairs(schedule['latency_pairs'])
+            self.latency_probers = LatencyProbers(self.net.hosts, pairs, self.record_latency_report,
+                                                  rate=schedule['latency_rate'],
+                                                  protocols=schedule['latency_protocols'],
+                                                  report_interval=schedule['interval'])
+            self.latency_probers.start()
+        if schedule['queue_interval'] and self.net.switches:
+            self.queue_collector = QueueStatsCollector(self.net, self.stats_collector, QOS_QUEUES,
+                                                       schedule['queue_interval'])
+            self.queue_collector.start()
         self.running = True
         self.monitor_thread = threading.Thread(target=self.monitor_network)
         self.monitor_thread.daemon = True
@@ -369,8 +1352,50 @@ class NetworkMonitor:
         self.running = False
         if self.monitor_thread:
             self.monitor_thread.join()
+        if self.latency_probers:
+            self.latency_probers.stop()
+        if self.queue_collector:
+            self.queue_collector.stop()
         print("Network monitoring stopped")
 
+def benchmark_counter_collection(interface_counts=(6, 60, 600), rounds=5):
+    """Time one sweep over every host interface with per-interface `ip -s link show`
+    calls, the same calls fanned out to all hosts at once, and one /proc/<pid>/net/dev
+    read per namespace"""
+    results = []
+    for count in interface_counts:
+        print(f"\nBuilding a single-switch network with {count} host interfaces...")
+        net = Mininet(topo=SingleSwitchTopo(k=count), switch=OVSSwitch, controller=None)
+        net.start()
+        try:
+            monitor = NetworkMonitor(net, None)
+            interfaces = [(host, intf.name) for host in net.hosts
+                          for intf in host.intfs.values() if intf.name != 'lo']
+
+            start = time.perf_counter()
+            for _ in range(rounds):
+                for host, intf in interfaces:
+                    monitor.get_interface_stats(host, intf)
+            per_interface = (time.perf_counter() - start) / rounds
+
+            start = time.perf_counter()
+            for _ in range(rounds):
+                monitor.get_all_interface_stats(interfaces)
+            fan_out = (time.perf_counter() - start) / rounds
+
+            start = time.perf_counter()
+            for _ in range(rounds):
+                for host in net.hosts:
+                    monitor.get_node_counters(host)
+            bulk = (time.perf_counter() - start) / rounds
+            results.append((len(interfaces), per_interface, fan_out, bulk))
+        finally:
+            net.stop()
+
+    print(f"\n{'Interfaces':>10} {'ip -s link (s)':>15} {'fanned out (s)':>15} {'/proc/net/dev (s)':>18} {'Speedup':>8}")
+    for count, per_interface, fan_out, bulk in results:
+        print(f"{count:>10} {per_interface:>15.4f} {fan_out:>15.4f} {bulk:>18.4f} {per_interface / bulk:>7.1f}x")
+
 def print_network_stats(stats_collector):
     """Print current network statistics"""
     stats = stats_collector.get_stats()
@@ -387,82 +1412,135 @@ def print_network_stats(stats_collector):
         print(f"Total Packets Received: {data['packets_recv']:,}")
         
         if data['bandwidth_history']:
-            recent_bandwidth = data['bandwidth_history'][-1]['bandwidth']
+            _, recent_bandwidth = data['bandwidth_history'].latest()
             print(f"Current Bandwidth: {recent_bandwidth:.2f} Mbps")
+            summary = data['bandwidth_history'].summary()
+            print(f"Bandwidth over last {summary['samples']} samples: min {summary['min']:.2f} / "
+                  f"mean {summary['mean']:.2f} / max {summary['max']:.2f} / p95 {summary['p95']:.2f} Mbps")
             
         if data['latency_history']:
-            recent_latency = data['latency_history'][-1]['latency']
+            _, recent_latency = data['latency_history'].latest()
             print(f"Current Latency: {recent_latency:.2f} ms")
+            summary = data['latency_history'].summary()
+            print(f"Latency over last {summary['samples']} samples: min {summary['min']:.2f} / "
+                  f"mean {summary['mean']:.2f} / max {summary['max']:.2f} / p95 {summary['p95']:.2f} ms")
+        
+        # Every probe of the run, per priority class
+        for protocol, histogram in sorted(data['latency_histograms'].items()):
+            sent, lost = data['probe_counts'][protocol]
+            if not histogram.total():
+                print(f"Latency {protocol.upper():<4}: no replies, {lost:,} of {sent:,} probes lost")
+                continue
+            p50, p99, p999 = (histogram.percentile(p) / 1000 for p in (50, 99, 99.9))
+            print(f"Latency {protocol.upper():<4}: p50 {p50:.3f} / p99 {p99:.3f} / p99.9 {p999:.3f} ms, "
+                  f"loss {100 * lost / max(1, sent):.2f}% of {sent:,} probes")
+        
+        # Switch queues towards this link's peer, against their configured rates
+        for queue_id, entry in sorted(data['queues'].items()):
+            if not entry['throughput_history']:
+                continue
+            summary = entry['throughput_history'].summary()
+            violations = entry['violations']
+            print(f"Queue {queue_id}: mean {summary['mean']:.2f} / max {summary['max']:.2f} Mbps over "
+                  f"{summary['samples']} samples, {entry['drops']:,} drops, "
+                  f"{violations['min-rate']} min-rate and {violations['max-rate']} max-rate violation(s)")
+
 
 
+# Queues configured on every switch port: queue id -> Queue other-config
+QOS_QUEUES = {
+    0: {'min-rate': 1000000, 'max-rate': 10000000},
+    1: {'min-rate': 5000000, 'max-rate': 15000000},
+    2: {'min-rate': 3000000, 'max-rate': 20000000},
+}
 
 def configure_switch_of13(switch):
     """Configure switch to use OpenFlow 1.3 and set up QoS"""
     print(f"Configuring {switch.name} for OpenFlow 1.3")
+    provision_qos([switch], QOS_QUEUES)
+
+# Flow table installed on every switch
+FLOW_RULES = [
+    # Table-miss flow entry
+    'table=0,priority=0,actions=CONTROLLER:65535',
+    
+    # ARP and LLDP flooding
+    'priority=65535,arp,actions=FLOOD',
+    'priority=65535,dl_type=0x88cc,actions=FLOOD',
+    
+    # ICMP traffic (high priority)
+    'priority=10000,ip,nw_proto=1,actions=set_queue:2,FLOOD',
     
-    # Set OpenFlow 1.3
-    switch.cmd('ovs-vsctl set Bridge', switch, 'protocols=OpenFlow13')
+    # TCP traffic (medium priority)
+    'priority=9000,tcp,actions=set_queue:1,FLOOD',
     
-    # Clear existing QoS configurations
-    for port in range(1, 5):  # Support up to 4 ports per switch
-        switch.cmd(f'ovs-vsctl clear Port {switch.name}-eth{port} qos')
+    # UDP traffic (low priority)
+    'priority=8000,udp,actions=set_queue:0,FLOOD',
     
-    # Configure QoS for each port with three queues
-    for port in range(1, 5):
-        cmd = f'''ovs-vsctl -- \
-                set Port {switch.name}-eth{port} qos=@newqos -- \
-                --id=@newqos create QoS type=linux-htb \
-                queues:0=@q0 \
-                queues:1=@q1 \
-                queues:2=@q2 -- \
-                --id=@q0 create Queue other-config:min-rate=1000000 \
-                                               other-config:max-rate=10000000 -- \
-                --id=@q1 create Queue other-config:min-rate=5000000 \
-                                               other-config:max-rate=15000000 -- \
-                --id=@q2 create Queue other-config:min-rate=3000000 \
-                                               other-config:max-rate=20000000'''
-        switch.cmd(cmd)
+    # Default rule for remaining IP traffic
+    'priority=5000,ip,actions=set_queue:0,FLOOD'
+]
 
 def add_openflow_rules(switch):
-    """Add OpenFlow rules to the switch"""
+    """Add OpenFlow rules to the switch, one ovs-ofctl per rule"""
     print(f"\nAdding OpenFlow rules to {switch.name}")
+    install_flow_rules(switch, FLOW_RULES)
+
+def start_network(timer, batched=True, topo_spec=None):
+    """Build, start and configure the QoS network, timing each phase.
+    batched=False configures switches one at a time, with one ovsdb transaction per
+    switch and one ovs-ofctl per rule. topo_spec selects a generated TopologySpec
+    instead of ExpandedQoSTopoOF13."""
+    with timer.phase('build'):
+        net = Mininet(
+            topo=topo_spec.topo() if topo_spec else ExpandedQoSTopoOF13(),
+            switch=OVSSwitch,
+            controller=Controller,
+            link=TCLink,
+            autoSetMacs=True,
+            build=False
+        )
+        net.build()
     
-    # Clear existing flows
-    switch.cmd('ovs-ofctl -O OpenFlow13 del-flows', switch)
-    
-    # Add table-miss flow entry
-    switch.cmd('ovs-ofctl -O OpenFlow13 add-flow', switch, 
-              'table=0,priority=0,actions=CONTROLLER:65535')
-    
-    # Add flow rules for different traffic types
-    flow_rules = [
-        # ARP and LLDP flooding
-        'priority=65535,arp,actions=FLOOD',
-        'priority=65535,dl_type=0x88cc,actions=FLOOD',
-        
-        # ICMP traffic (high priority)
-        'priority=10000,ip,nw_proto=1,actions=set_queue:2,FLOOD',
-        
-        # TCP traffic (medium priority)
-        'priority=9000,tcp,actions=set_queue:1,FLOOD',
-        
-        # UDP traffic (low priority)
-        'priority=8000,udp,actions=set_queue:0,FLOOD',
-        
-        # Default rule for remaining IP traffic
-        'priority=5000,ip,actions=set_queue:0,FLOOD'
-    ]
-    
-    # Add each rule
-    for rule in flow_rules:
-        switch.cmd('ovs-ofctl -O OpenFlow13 add-flow', switch, rule)
+    with timer.phase('start'):
+        net.start()
+    with timer.phase('controller connect'):
+        wait_connected(net)
     
-    # Verify flows
-    print(f"\nVerifying flows on {switch.name}:")
-    print(switch.cmd('ovs-ofctl -O OpenFlow13 dump-flows', switch))
+    if batched:
+        with timer.phase('switch config'):
+            # One ovsdb transaction for the whole network
+            provision_qos(net.switches, QOS_QUEUES)
+        with timer.phase('flow install'):
+            print(f"\nAdding OpenFlow rules to {', '.join(switch.name for switch in net.switches)}")
+            push_flow_rules(net.switches, FLOW_RULES)
+    else:
+        with timer.phase('switch config'):
+            for switch in net.switches:
+                configure_switch_of13(switch)
+        with timer.phase('flow install'):
+            for switch in net.switches:
+                add_openflow_rules(switch)
+    return net
 
-def test_network(net):
+def benchmark_startup():
+    """Compare bring-up with sequential per-rule flow installs against parallel batched installs"""
+    timers = {}
+    for label, batched in (('sequential, one add-flow per rule', False),
+                           ('parallel, one bundle per switch', True)):
+        os.system('mn -c > /dev/null 2>&1')
+        timer = StartupTimer()
+        net = start_network(timer, batched=batched)
+        net.stop()
+        timers[label] = timer
+    for label, timer in timers.items():
+        timer.report(f'Startup time by phase ({label})')
+
+def test_network(net, iperf_pool=None):
     """Test network connectivity and QoS"""
+    own_pool = iperf_pool is None
+    if own_pool:
+        iperf_pool = IperfServerPool()
     print("\nTesting network connectivity:")
     
     # Get hosts
@@ -499,26 +1577,17 @@ def test_network(net):
         dst.waitOutput()
         
         try:
-            # Start iperf server with specific pid file
-            dst.cmd('iperf -s > /dev/null 2>&1 & echo $! > /tmp/iperf_server.pid')
-            # Wait a moment for server to start
-            time.sleep(2)
+            # Use the destination's pooled iperf server
+            port = iperf_pool.ensure(dst)
+            if port is None:
+                continue
             
             # Run iperf client
-            iperf_result = src.cmd(f'iperf -c {dst.IP()} -t 5')
+            iperf_result = src.cmd(f'iperf -c {dst.IP()} -t 5 -p {port}')
             print(iperf_result)
             
-            # Cleanup iperf server
-            dst.cmd('kill $(cat /tmp/iperf_server.pid)')
-            dst.cmd('rm -f /tmp/iperf_server.pid')
-            
-            # Additional cleanup to ensure iperf is fully terminated
-            dst.cmd("pkill -9 iperf")
-            
         except Exception as e:
             print(f"Error during bandwidth test between {src.name} and {dst.name}: {e}")
-            # Cleanup in case of error
-            dst.cmd("pkill -9 iperf")
         
         # Ensure commands are finished before proceeding
         src.waitOutput()
@@ -526,62 +1595,105 @@ def test_network(net):
         
         # Small delay between tests
         time.sleep(1)
-        
+    
+    if own_pool:
+        iperf_pool.stop()
         
         
         
 def main():
+    parser = argparse.ArgumentParser(description='QoS network with statistics monitoring')
+    parser.add_argument('--bench-stats', action='store_true',
+                        help='Benchmark NetworkStats CSV writing and exit')
+    parser.add_argument('--bench-counters', action='store_true',
+                        help='Benchmark interface counter collection at 6/60/600 interfaces and exit')
+    parser.add_argument('--bench-startup', action='store_true',
+                        help='Benchmark network bring-up per phase, sequential vs batched switch setup, and exit')
+    parser.add_argument('--topo', type=TopologySpec.parse, default=None,
+                        help='Generated topology instead of the 6-host one, e.g. fattree:k=4 or '
+                             'ring:switches=20,hosts_per_switch=5,core.bw=100')
+    parser.add_argument('--estimate', action='store_true',
+                        help='Print the expected bring-up cost of --topo and exit')
+    parser.add_argument('--capture-profile', choices=sorted(CAPTURE_PROFILES), default=DEFAULT_CAPTURE_PROFILE,
+                        help='tcpdump snaplen and rotation profile (default full: whole packets, nothing '
+                             'overwritten; headers keeps a 2 GB ring of 128-byte snaps), or counters for '
+                             'per-protocol tc counters without pcaps (see CAPTURE_PROFILES)')
+    parser.add_argument('--stats-backend', choices=('sqlite', 'csv'), default=STATS_BACKEND,
+                        help='Store monitoring samples in network_stats/network_stats.db or directly as CSV')
+    parser.add_argument('--export-csv', action='store_true',
+                        help='With the sqlite backend, also write the CSV files when the run ends')
+    parser.add_argument('--trace', default='startup_trace.json',
+                        help='Where to write the Chrome trace of network bring-up')
+    parser.add_argument('--probe-schedule', type=json.loads, default=None,
+                        help='JSON overrides for PROBE_SCHEDULE, e.g. \'{"interval": 2, "bandwidth_pairs": "mesh"}\'')
+    args = parser.parse_args()
+    if args.bench_stats:
+        benchmark_network_stats()
+        return
+    if args.bench_counters:
+        setLogLevel('warning')
+        os.system('mn -c')
+        benchmark_counter_collection()
+        return
+    if args.estimate:
+        if not args.topo:
+            parser.error('--estimate needs --topo')
+        args.topo.report()
+        return
+    if args.bench_startup:
+        os.system('killall controller')
+        benchmark_startup()
+        return
+
     setLogLevel('info')
+    timer = StartupTimer()
     
     # Clean up any previous run
-    os.system('mn -c')
-    os.system('killall controller')
-    os.system('pkill -f tcpdump')  # Add this line to clean up any lingering tcpdump processes
+    with timer.phase('cleanup'):
+        os.system('mn -c')
+        os.system('killall controller')
+        os.system('pkill -f tcpdump')  # Captures left behind by a previous run that crashed
     
     print("Starting QoS network with statistics monitoring")
     
-    # Initialize network and statistics collector
-    topo = ExpandedQoSTopoOF13()
-    stats_collector = NetworkStats(csv_output_dir='network_stats')
+    # Initialize statistics collector, then create, start and configure the network
+    stats_collector = NetworkStats(csv_output_dir='network_stats', backend=args.stats_backend)
+    if args.topo:
+        args.topo.report()
+    with timer.trace_commands():
+        net = start_network(timer, topo_spec=args.topo)
     
-    # Create and start network
-    net = Mininet(
-        topo=topo,
-        switch=OVSSwitch,
-        controller=Controller,
-        link=TCLink,
-        autoSetMacs=True
-    )
-    
-    net.start()
-    print("Waiting for network to initialize...")
-    sleep(2)
-    
-    # Initialize TCPDump collector
-    tcpdump_collector = TCPDumpCollector(net, output_dir='tcpdump_data')
-    
-    # Configure switches and add flows
-    for switch in net.switches:
-        configure_switch_of13(switch)
-        add_openflow_rules(switch)
+    # Initialize TCPDump collector with live per-protocol analysis of the captures
+    live_monitor = LiveBandwidthMonitor(interval=1.0)
+    tcpdump_collector = TCPDumpCollector(net, output_dir='tcpdump_data', live_monitor=live_monitor,
+                                         profile=args.capture_profile)
+    monitor = None
     
     try:
-        # Start tcpdump on all hosts
-        for host in net.hosts:
-            tcpdump_collector.start_capture(host)
-        
-        # Initialize and start network monitor
-        monitor = NetworkMonitor(net, stats_collector)
-        monitor.start_monitoring()
+        with timer.trace_commands():
+            # Start tcpdump on all hosts
+            with timer.phase('captures'):
+                tcpdump_collector.start_captures(net.hosts)
+                live_monitor.start()
+            
+            # Initialize and start network monitor
+            with timer.phase('monitor start'):
+                iperf_pool = IperfServerPool()
+                monitor = NetworkMonitor(net, stats_collector, args.probe_schedule, iperf_pool)
+                monitor.start_monitoring()
+        timer.report()
+        timer.write_trace(args.trace)
         
         # Add custom commands to Mininet CLI
         CLI.do_showstats = lambda self, _: print_network_stats(stats_collector)
         CLI.do_stoptcpdump = lambda self, _: tcpdump_collector.stop_capture()
+        CLI.do_livestats = lambda self, _: live_monitor.print_rates()
         
         print("\nNetwork is ready.")
         print("Available commands:")
         print("  showstats - Show current network statistics")
         print("  stoptcpdump - Stop all tcpdump captures")
+        print("  livestats - Show live per-protocol bandwidth from the running captures")
         CLI(net)
         
     except Exception as e:
@@ -590,10 +1702,18 @@ def main():
     finally:
         # Cleanup
         print("Cleaning up...")
+        # Stop the probes first: they use the host shells that capture cleanup fans out to.
+        # The monitor does not exist yet if starting the captures failed.
+        if monitor:
+            monitor.stop_monitoring()
         tcpdump_collector.cleanup()
-        monitor.stop_monitoring()
+        live_monitor.stop()
+        if monitor:
+            monitor.iperf_pool.stop()
+        stats_collector.close()
+        if args.export_csv and args.stats_backend == 'sqlite':
+            stats_collector.export_csv()
         net.stop()
-        os.system('pkill -f tcpdump')  # Final cleanup of any remaining tcpdump processes
 
 if __name__ == '__main__':
     main()
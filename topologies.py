@@ -0,0 +1,242 @@
+"""
+Parametric topologies for running the QoS experiments at scale.
+
+A TopologySpec names a topology kind (linear, ring, fattree, random), its size
+parameters and the link QoS profiles (bw, delay, loss) to use per link role:
+    edge         host <-> switch
+    aggregation  edge switch <-> aggregation switch (fat-tree only)
+    core         every other switch <-> switch link
+
+Nothing is built until spec.topo() is called; the nodes and links come from a
+generator that Mininet consumes while it builds the Topo. spec.estimate() walks the
+same generator to count what bring-up will create (namespaces, veth pairs, tc
+commands, ovsdb rows, ...) and turns that into an expected cost.
+
+Specs can be written on the command line as kind:key=value,..., with profile
+overrides as role.key=value, e.g.
+    fattree:k=4
+    ring:switches=20,hosts_per_switch=5,core.bw=100,edge.delay=1ms
+"""
+import random
+from mininet.topo import Topo
+from mininet.link import TCLink
+
+# Link QoS per role; the defaults match ExpandedQoSTopoOF13
+LINK_PROFILES = {
+    'edge': {'bw': 10, 'delay': '5ms', 'loss': 1},
+    'aggregation': {'bw': 20, 'delay': '2ms', 'loss': 0},
+    'core': {'bw': 20, 'delay': '2ms', 'loss': 0},
+}
+
+TOPOLOGY_DEFAULTS = {
+    'linear': {'switches': 4, 'hosts_per_switch': 2},
+    'ring': {'switches': 4, 'hosts_per_switch': 2},
+    'fattree': {'k': 4},
+    'random': {'switches': 10, 'hosts_per_switch': 2, 'extra_links': None, 'seed': 1},
+}
+
+# Rough per-operation costs in seconds, used only for the bring-up estimate.
+# Recalibrate against the phase report printed by start_network / --bench-startup.
+BRINGUP_COSTS = {
+    'namespace': 0.010,     # host shell + network namespace
+    'switch': 0.050,        # OVS bridge
+    'link': 0.020,          # veth pair + OVS port
+    'tc': 0.005,            # one tc command
+    'flow_bundle': 0.010,   # one ovs-ofctl replace-flows per switch
+    'arp_batch': 0.010,     # one ip -batch per host
+    'arp_entry': 0.0001,    # one neighbor entry within a batch
+}
+TC_CMDS_PER_INTF = 4        # TCLink with bw + delay/loss: qdisc cleanup, htb, class, netem
+QOS_QUEUES_PER_PORT = 3
+
+def parse_value(text):
+    for kind in (int, float):
+        try:
+            return kind(text)
+        except ValueError:
+            pass
+    return None if text == 'None' else text
+
+class TopologySpec:
+    """Kind, size parameters and link profiles of a generated topology"""
+    def __init__(self, kind, profiles=None, **params):
+        if kind not in TOPOLOGY_DEFAULTS:
+            raise ValueError(f"Unknown topology {kind!r}, expected one of {', '.join(TOPOLOGY_DEFAULTS)}")
+        unknown = set(params) - set(TOPOLOGY_DEFAULTS[kind])
+        if unknown:
+            raise ValueError(f"Unknown parameter(s) for {kind}: {', '.join(sorted(unknown))}")
+        self.kind = kind
+        self.params = dict(TOPOLOGY_DEFAULTS[kind], **params)
+        self.profiles = {role: dict(profile) for role, profile in LINK_PROFILES.items()}
+        for role, overrides in (profiles or {}).items():
+            self.profiles.setdefault(role, {}).update(overrides)
+        if kind == 'fattree' and self.params['k'] % 2:
+            raise ValueError("fattree needs an even k")
+
+    @classmethod
+    def parse(cls, text):
+        """Build a spec from 'kind:key=value,role.key=value,...'"""
+        kind, _, options = text.partition(':')
+        params, profiles = {}, {}
+        for option in filter(None, options.split(',')):
+            key, _, value = option.partition('=')
+            if '.' in key:
+                role, key = key.split('.', 1)
+                profiles.setdefault(role, {})[key] = parse_value(value)
+            else:
+                params[key] = parse_value(value)
+        return cls(kind, profiles, **params)
+
+    def __str__(self):
+        params = ','.join(f'{key}={value}' for key, value in self.params.items())
+        return f'{self.kind}:{params}'
+
+    def layout(self):
+        """Yield ('switch', name), ('host', name) and ('link', node1, node2, role).
+        Nodes are always yielded before the links that use them."""
+        return getattr(self, f'layout_{self.kind}')()
+
+    def layout_linear(self, ring=False):
+        switches = self.params['switches']
+        hosts_per_switch = self.params['hosts_per_switch']
+        host = 0
+        for i in range(1, switches + 1):
+            yield ('switch', f's{i}')
+            for _ in range(hosts_per_switch):
+                host += 1
+                yield ('host', f'h{host}')
+                yield ('link', f'h{host}', f's{i}', 'edge')
+            if i > 1:
+                yield ('link', f's{i - 1}', f's{i}', 'core')
+        if ring and switches > 2:
+            yield ('link', f's{switches}', 's1', 'core')
+
+    def layout_ring(self):
+        return self.layout_linear(ring=True)
+
+    def layout_fattree(self):
+        k = self.params['k']
+        half = k // 2
+        count = 0
+
+        def switch():
+            nonlocal count
+            count += 1
+            return f's{count}'
+
+        core = [switch() for _ in range(half * half)]
+        for name in core:
+            yield ('switch', name)
+        host = 0
+        for _ in range(k):
+            aggregation = [switch() for _ in range(half)]
+            edge = [switch() for _ in range(half)]
+            for name in aggregation + edge:
+                yield ('switch', name)
+            for i, agg in enumerate(aggregation):
+                # Aggregation switch i of every pod uplinks to core group i
+                for core_switch in core[i * half:(i + 1) * half]:
+                    yield ('link', agg, core_switch, 'core')
+                for edge_switch in edge:
+                    yield ('link', edge_switch, agg, 'aggregation')
+            for edge_switch in edge:
+                for _ in range(half):
+                    host += 1
+                    yield ('host', f'h{host}')
+                    yield ('link', f'h{host}', edge_switch, 'edge')
+
+    def layout_random(self):
+        switches = self.params['switches']
+        extra_links = self.params['extra_links']
+        if extra_links is None:
+            extra_links = switches // 2
+        # Seeded so estimate() and topo() generate the same graph
+        rng = random.Random(self.params['seed'])
+        host = 0
+        linked = set()
+        for i in range(1, switches + 1):
+            yield ('switch', f's{i}')
+            for _ in range(self.params['hosts_per_switch']):
+                host += 1
+                yield ('host', f'h{host}')
+                yield ('link', f'h{host}', f's{i}', 'edge')
+            if i > 1:
+                # Random spanning tree keeps the graph connected
+                peer = rng.randint(1, i - 1)
+                linked.add((peer, i))
+                yield ('link', f's{peer}', f's{i}', 'core')
+        max_links = switches * (switches - 1) // 2
+        attempts = 0
+        while extra_links > 0 and len(linked) < max_links and attempts < 100 * switches:
+            attempts += 1
+            a, b = sorted(rng.sample(range(1, switches + 1), 2))
+            if (a, b) not in linked:
+                linked.add((a, b))
+                extra_links -= 1
+                yield ('link', f's{a}', f's{b}', 'core')
+
+    def topo(self):
+        """Build the Mininet Topo now"""
+        return GeneratedQoSTopo(self)
+
+    def estimate(self):
+        """Count what bring-up will create, without building anything"""
+        hosts = switches = host_links = switch_links = 0
+        for item in self.layout():
+            if item[0] == 'host':
+                hosts += 1
+            elif item[0] == 'switch':
+                switches += 1
+            elif item[3] == 'edge':
+                host_links += 1
+            else:
+                switch_links += 1
+        links = host_links + switch_links
+        switch_ports = host_links + 2 * switch_links
+        counts = {
+            'hosts': hosts,
+            'switches': switches,
+            'links': links,
+            'switch ports': switch_ports,
+            'tc commands': 2 * links * TC_CMDS_PER_INTF,
+            'QoS/Queue rows': switch_ports * (1 + QOS_QUEUES_PER_PORT),
+            'static ARP entries': hosts * (hosts - 1),
+            'probe pairs (mesh)': hosts * (hosts - 1) // 2,
+            # Links beyond a spanning tree; FLOOD rules need STP on these
+            'loops': max(0, switch_links - (switches - 1)),
+        }
+        seconds = {
+            'namespaces': hosts * BRINGUP_COSTS['namespace'],
+            'switches': switches * BRINGUP_COSTS['switch'],
+            'links': links * BRINGUP_COSTS['link'],
+            'tc': counts['tc commands'] * BRINGUP_COSTS['tc'],
+            'flow install': switches * BRINGUP_COSTS['flow_bundle'],
+            'static ARP': (hosts * BRINGUP_COSTS['arp_batch'] +
+                           counts['static ARP entries'] * BRINGUP_COSTS['arp_entry']),
+        }
+        return counts, seconds
+
+    def report(self):
+        counts, seconds = self.estimate()
+        print(f"\nTopology {self}:")
+        for name, count in counts.items():
+            print(f"  {name:<20} {count:>10}")
+        print("Expected bring-up cost:")
+        for name, cost in seconds.items():
+            print(f"  {name:<20} {cost:>9.2f}s")
+        print(f"  {'total':<20} {sum(seconds.values()):>9.2f}s")
+        if counts['loops']:
+            print(f"  note: {counts['loops']} loop link(s); flooding rules will storm without STP")
+        return counts, seconds
+
+class GeneratedQoSTopo(Topo):
+    """Topo built from a TopologySpec as its layout is generated"""
+    def build(self, spec):
+        for item in spec.layout():
+            if item[0] == 'switch':
+                self.addSwitch(item[1], protocols='OpenFlow13')
+            elif item[0] == 'host':
+                self.addHost(item[1])
+            else:
+                _, node1, node2, role = item
+                self.addLink(node1, node2, cls=TCLink, **spec.profiles[role])